@@ -34,8 +34,12 @@ I will try to start using following terms consistently:
 # Import utility module(s) for consistency.
 from . import _util
 from . import _base
+from . import checkpoint
 from . import iterbased
 from . import bitbased
+from . import bitbranch
+from . import bitmiddle
+from . import bitcover
 from . import iterold
 # from . import bitold  # Implementation no longer in service.
 
@@ -43,6 +47,7 @@ from . import iterold
 try:
     from . import bitnumpy
     from . import bitparallel
+    from . import bitcluster
 except ImportError as err:
     # print('\nNote: numpy implementations unavailable:', err, '\n')
     pass
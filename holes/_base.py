@@ -5,8 +5,10 @@ Holes base class module.
 import sys
 import platform
 import time
+import itertools
 import os.path
 from . import _util
+from . import bounds
 
 __all__ = []
 __version__ = _util.__version__
@@ -44,8 +46,52 @@ class HolesBase:
     implementation_key = 'overrideme'
     implementation_name = 'base class - please override'
 
+    # What do_run() and friends gather from best_combos().
+    MODES = ('all', 'one', 'count')
+
     def __init__(self):
         self.stats = dict()
+        # Best dotcounts found by earlier runs, by distance.
+        self.known_best = dict()
+        # (first, last) dotcounts worth searching, by distance.
+        self.dotcount_bounds = dict()
+        # 'all' best combos, just 'one' of them, or just 'count'
+        # them, see MODES.
+        self.mode = 'all'
+        # The last do_run() or similar's results & performance.
+        self.run_summary = dict()
+        # A checkpoint.Checkpoint do_run() keeps saving, so the run
+        # can be resumed, or None.
+        self.checkpoint = None
+
+
+    def close(self):
+        """
+        Release anything an implementation holds on to between runs,
+        like worker processes.  Nothing by default.
+        """
+        pass
+
+
+    def cancel(self):
+        """
+        Stop any search still going on in the background, as soon
+        as it can, like worker processes after an exception or
+        Ctrl-C.  Nothing by default.
+        """
+        pass
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Leaving on an exception, so nobody wants what is left.
+        if exc_type is not None:
+            self.cancel()
+        self.close()
+        return False
 
 
     # Suggested methods.  Subclasses do not have to implement. {{{
@@ -97,6 +143,47 @@ class HolesBase:
         # }}}
 
 
+    def dotcount_range(self, distance):
+        # {{{
+        """
+        Dotcounts best_combos should search, fewest dots first.
+        Without bounds from plan_dotcounts(), that is every dotcount
+        that could span the distance, 2 through distance + 1.
+        """
+        first, last = self.dotcount_bounds.get(distance,
+                                               (2, distance + 1))
+        return range(max(first, 2), last + 1)
+        # }}}
+
+
+    def plan_dotcounts(self, distance):
+        # {{{
+        """
+        Narrow the dotcounts best_combos will search for distance
+        using the bounds module, and log how many it skips and why.
+        The search stops at the ceiling of a known construction,
+        since there is always a combo with that many dots.
+        Returns the number of dotcounts skipped.
+        """
+        first, reason = bounds.lower_bound(distance, self.known_best)
+        first = max(first, 2)
+        last, last_reason = bounds.upper_bound(distance)
+        last = min(last, distance + 1)
+        self.dotcount_bounds[distance] = (first, last)
+
+        skipped = first - 2
+        if skipped:
+            FMT = 'Starting at {} dots - skipped {} dotcounts - {}'
+            logger.info(FMT.format(first, skipped, reason))
+        FMT = 'Stopping by {} dots - {}'
+        logger.info(FMT.format(last, last_reason))
+        if first == last:
+            FMT = 'Best dotcount {} proven by bounds, searching only it'
+            logger.info(FMT.format(first))
+        return skipped
+        # }}}
+
+
     def do_run(self, distance):
         # {{{
         """
@@ -109,17 +196,33 @@ class HolesBase:
         logger.info('-' * 30)
         logger.info('Best combos for length {} ...'.format(distance))
         logger.debug('Using {}'.format(self.implementation_name))
+        skipped = self.plan_dotcounts(distance)
+        if self.checkpoint is not None:
+            self.resume_checkpoint(distance)
 
         # Do everything, converting to a tuple to make sure it
         # fully iterates everything before we record completion time.
+        # In find-one mode, stop at the first, which is all we need.
+        # In count-only mode, there are no combos to return at all.
         start_time = time.time()
-        combos = tuple(self.best_combos(distance))
+        if self.mode == 'count':
+            combos = ()
+            n_dots, count = self.count_best_combos(distance)
+        else:
+            combos = self.collect_combos(self.best_combos(distance))
+            count = len(combos)
+            n_dots = len(combos[0]) if combos else None
         end_time = time.time()
+        # Nothing to record, and no best dotcount for bounds to use.
+        if not count:
+            raise ValueError('No best combos found for length {}'
+                             .format(distance))
+        if self.checkpoint is not None:
+            self.checkpoint.finish()
 
         # Log completion
         elapsed_time = end_time - start_time
-        count = len(combos)
-        n_dots = len(combos[0])
+        self.known_best[distance] = n_dots
         FMT='Best combos for length {} - found {} - took {:.3f} sec'
         logger.info(FMT.format(distance, count, elapsed_time))
 
@@ -131,13 +234,110 @@ class HolesBase:
             'distance': distance,
             'time_elapsed': elapsed_time,
             'result_n_dots': n_dots,
-            'result_count': count,}
+            'result_count': count,
+            'dotcounts_skipped': skipped,
+            'dotcount_ceiling': self.dotcount_bounds[distance][1],
+            'mode': self.mode,}
+        run_summary.update(self.run_summary_extras(distance))
+        self.log_performance(run_summary)
+        self.run_summary = run_summary
+
+        return combos
+        # }}}
+
+
+    def resume_checkpoint(self, distance):
+        # {{{
+        """
+        Start self.checkpoint for a run for distance, and if it is
+        resuming one, skip the dotcounts it already searched.  How
+        much of its dotcount to skip is up to the implementation,
+        which can also report progress, see checkpoint.py.
+        """
+        dotcount = self.checkpoint.start(distance, self.mode)
+        if dotcount is None:
+            return
+        first, last = self.dotcount_bounds[distance]
+        self.dotcount_bounds[distance] = (max(first, dotcount), last)
+        FMT = 'Resuming at {} dots from checkpoint {}'
+        logger.info(FMT.format(dotcount, self.checkpoint.filename))
+        # }}}
+
+
+    def count_best_combos(self, distance):
+        # {{{
+        """
+        How many best combos there are for distance, for count-only
+        mode, without keeping them around.  Returns (dots, count),
+        the number of dots in each best combo and how many there are.
+        Subclasses can count without making combos at all.
+        """
+        n_dots, count = None, 0
+        for count, combo in enumerate(self.best_combos(distance),
+                                      start=1):
+            n_dots = len(combo)
+        return n_dots, count
+        # }}}
+
+
+    def collect_combos(self, combos):
+        # {{{
+        """
+        Gather combos from a best_combos() iterator into a tuple,
+        all of them, or in find-one mode, just the first, without
+        generating any more.
+        """
+        if self.mode == 'one':
+            return tuple(itertools.islice(combos, 1))
+        return tuple(combos)
+        # }}}
+
+
+    def do_construction_run(self, distance):
+        # {{{
+        """
+        Instead of searching, get a good combo, maybe not optimal,
+        from the constructions module, with a performance summary.
+        """
+        # Imported here to avoid a circular import, see bounds.py.
+        from . import constructions
+
+        self.stats = dict()
+        logger.info('-' * 30)
+        logger.info('Construction for length {} ...'.format(distance))
+
+        start_time = time.time()
+        combos = (constructions.best_construction(distance),)
+        end_time = time.time()
+
+        elapsed_time = end_time - start_time
+        n_dots = len(combos[0])
+        FMT='Construction for length {} - {} dots - took {:.3f} sec'
+        logger.info(FMT.format(distance, n_dots, elapsed_time))
+        run_summary = {
+            'action': 'construction',
+            'distance': distance,
+            'time_elapsed': elapsed_time,
+            'result_n_dots': n_dots,
+            'result_count': len(combos),}
         self.log_performance(run_summary)
+        self.run_summary = run_summary
 
         return combos
         # }}}
 
 
+    def run_summary_extras(self, distance):
+        # {{{
+        """
+        Implementation specific additions to the performance summary
+        of a run for distance, which log_performance() puts on its
+        ~perfextra~ lines.  None by default.
+        """
+        return dict()
+        # }}}
+
+
     def log_progress(self, iterable, label='', step=1000000):
         # {{{
         """
@@ -235,9 +435,21 @@ class HolesBase:
         HEAD_FORMAT_V02 = HEAD_FORMAT_V02.replace('d}','s}')
         HEAD_FORMAT_V02 = HEAD_FORMAT_V02.replace('12,.3f}','12s}')
 
+        # Anything else in run_summary does not fit the v02 format,
+        # so gets its own, more free-form pair of lines.
+        V02_KEYS = ('action', 'distance', 'time_elapsed',
+                    'result_n_dots', 'result_count')
+        extras = sorted(keyname for keyname in run_summary
+                        if keyname not in V02_KEYS)
+        EXTRA_FORMAT = '  ~perfextra~  ' + ''.join(
+            ',{' + keyname + '!s:<18} ' for keyname in extras)
+
         # Log it.
         logger.info(HEAD_FORMAT_V02.format(** headers))
         logger.info(PERF_FORMAT_V02.format(** perf_summary))
+        if extras:
+            logger.info(EXTRA_FORMAT.format(** headers))
+            logger.info(EXTRA_FORMAT.format(** perf_summary))
 
         # Log provisional additions for next perf format.
         logger.debug(PROVISIONAL_FORMAT.format(** prov_headers))
@@ -281,7 +493,10 @@ class HolesBase:
         for label in self.stats.keys():
             # ToDo: Move feeder names to subclasses..or something.
             if (label.startswith('combos_with_n_dots') or
-                label.startswith('bit_combos_with_ends')):
+                label.startswith('bit_combos_with_ends') or
+                label.startswith('bit_combos_covering_top') or
+                label.startswith('bit_combos_branched') or
+                label.startswith('bit_combos_covered')):
                 feeders.append(label)
             else:
                 mainline.append(label)
@@ -275,6 +275,42 @@ def bits_from_sequence(sequence):
     # }}}
 
 
+def mirror_bits(bits_int, distance):
+    # {{{
+    """
+    Flip the bitwise encoding of points end to end, as if the points
+    were on a ruler spanning distance that was turned around.
+    Position p becomes position distance - p.
+    Example:
+        mirror_bits(0b1001101, 6) would return 0b1011001
+        ((0,2,3,6) becomes (0,3,4,6))
+    """
+    binstr = '{:0{}b}'.format(bits_int, distance + 1)
+    return int(binstr[::-1], 2)
+    # }}}
+
+
+def bit_count(bits_int):
+    # {{{
+    """
+    The number of 1 bits in a non-negative integer, which for a
+    bitwise combo is the number of dots.  Uses the faster
+    int.bit_count() where there is one.
+    Example:
+        bit_count(0b1001101) would return 4
+    """
+    return _bit_count(bits_int)
+    # }}}
+
+
+# Make int.bit_count() optional, it is new in Python 3.10.
+try:
+    _bit_count = int.bit_count
+except AttributeError:
+    def _bit_count(bits_int):
+        return bin(bits_int).count('1')
+
+
 def combinations_count(iterable, r):
     # {{{
     """
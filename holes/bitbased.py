@@ -13,7 +13,9 @@ This is done in an attempt to improve CPU-bound speed and have fun.
 
 
 import logging  # {{{
+import time
 import functools
+import itertools
 from . import _base
 from . import _util
 from . import gospers
@@ -44,6 +46,14 @@ class HolesBitwise(_base.HolesBase):
 
     def __init__(self):
         super().__init__()
+        # Canonical mode searches only one of each mirror image pair.
+        self.canonical = False
+        # Skip generating runs of combos that cannot measure.
+        self.prune_prefixes = True
+        # Only generate combos measuring this many of the largest
+        # distances, see bit_combos_covering_top().  1 means just
+        # combos with both endpoints.
+        self.top_width = 6
 
 
     def combos_with_n_dots(self, distance, dotcount):
@@ -87,7 +97,7 @@ class HolesBitwise(_base.HolesBase):
         # }}}
 
 
-    def bit_combos_with_ends(self, distance, dotcount):
+    def bit_combos_with_ends(self, distance, dotcount, prune=False):
         # {{{
         """
         All bitwise combos with n dots that contain both endpoints.
@@ -96,6 +106,8 @@ class HolesBitwise(_base.HolesBase):
         distance - the distance of max endpoint - min endpoint,
         which means there are DISTANCE+1 possible point positions.
         Ex: distance=3 makes 4 digit binary #s, with outer digits 1.
+        prune - skip runs of combos that cannot possibly measure
+        distance, see bit_combos_pruned().  Not all combos then.
         """
         # Distance 1 is a special case to avoid 0-length inner combo.
         if distance == 1 and dotcount == 2:
@@ -103,6 +115,13 @@ class HolesBitwise(_base.HolesBase):
             yield bit_combo
             return
 
+        if prune:
+            given_bits = (1 << distance) | 1
+            for bit_combo in self.bit_combos_pruned(
+                    distance, dotcount, given_bits, 1, distance - 1):
+                yield bit_combo
+            return
+
         # Get bit combos 2 bits shorter with 2 fewer dots.
         inner_bit_combos = self.bit_combos_with_n_dots(distance - 2,
                                                        dotcount - 2)
@@ -116,7 +135,400 @@ class HolesBitwise(_base.HolesBase):
         # }}}
 
 
-    #def good_bit_combos_with_n_dots(self, distance, dotcount):
+    def bit_combos_with_givens(
+            self, distance, dotcount, leading=(), trailing=(),
+            prune=False):
+        # {{{
+        """
+        All bitwise combos with dotcount dots that include some
+        fixed given leading or trailing bits.  This can be useful
+        A) to reduce the number of combinations generated if you
+           already know both the first and last bit must be 1's, and
+        B) to fill in other known bits, perhaps to break apart the
+           overall generation across 2 cluster nodes by having
+           one node generate all combos starting with 0, and the
+           other node generate all combos starting with 1.
+        The geven leading and trailing bits are passed as
+        tuples of 0's and 1's.
+        prune - skip runs of combos that cannot possibly measure
+        distance, see bit_combos_pruned().  Not all combos then.
+        """
+        # TODO: Move to _util ?
+        def tuple_to_bits(tuple):
+            bits = 0
+            for value in tuple:
+                bits <<= 1
+                if value == 1:
+                    bits |= 1
+                elif value == 0:
+                    pass
+                else:
+                    raise ValueError("Given tuple values must be 0's or 1's")
+            return bits
+
+        def bitmask_of_givens(distance, leading, trailing):
+            length = distance + 1
+            leading_bits = tuple_to_bits(leading)
+            leading_bits <<= (length - len(leading))
+            trailing_bits = tuple_to_bits(trailing)
+            given_bits = leading_bits | trailing_bits
+            return given_bits
+
+        def dotcount_of_givens(leading, trailing):
+            count = 0
+            for value in leading:
+                if value == 1:
+                    count += 1
+            for value in trailing:
+                if value == 1:
+                    count += 1
+            return count
+
+        inner_distance = distance - len(leading) - len(trailing)
+        inner_length = inner_distance + 1
+        inner_dotcount = dotcount - dotcount_of_givens(leading, trailing)
+        if inner_length < 0:
+            raise ValueError(("Distance {} must at least cover given " +
+                              "leading ({}) and trailing({}) bits").format(
+                               distance, leading, trailing))
+        if inner_dotcount < 0:
+            raise ValueError(("Dotcount {} must at least cover given " +
+                              "leading ({}) and trailing({}) bits").format(
+                               dotcount, leading, trailing))
+
+        given_bits = bitmask_of_givens(distance, leading, trailing)
+
+        # Avoid 0-length inner combo.
+        if inner_length == 0:
+            if inner_dotcount == 0:
+                bit_combo = given_bits
+                yield bit_combo
+            return
+
+        if prune:
+            for bit_combo in self.bit_combos_pruned(
+                    distance, dotcount, given_bits,
+                    len(trailing), inner_length):
+                yield bit_combo
+            return
+
+        inner_bit_combos = self.bit_combos_with_n_dots(inner_distance,
+                                                       inner_dotcount)
+        for bit_combo in inner_bit_combos:
+            # Move inner bits over and stick given bits back on each end.
+            bit_combo <<= len(trailing)
+            bit_combo |= given_bits
+            yield bit_combo
+        # }}}
+
+
+    def bit_combos_pruned(self, distance, dotcount, given_bits,
+                          low, inner_length):
+        # {{{
+        """
+        Bitwise combos with dotcount dots, including given_bits, with
+        the rest of the dots in the inner_length positions starting
+        at position low.  Runs of combos sharing high bits that
+        cannot measure distance no matter what the lower bits are
+        get skipped, using gospers.bit_combos_gospers_pruned().
+        """
+        inner_dotcount = dotcount - _util.bit_count(given_bits)
+        if inner_dotcount < 0 or inner_dotcount > inner_length:
+            raise ValueError('dotcount must fit given bits and ' +
+                             'inner positions.')
+        needed = (1 << (distance + 1)) - 2
+
+        def feasible(prefix, position):
+            fixed = given_bits | (prefix << low)
+            free = inner_dotcount - _util.bit_count(prefix)
+            return self.bit_prefix_can_measure(
+                fixed, self.bit_prefix_measures(fixed), needed,
+                free, position + low, low)
+
+        skipped = [0]
+        start_time = time.time()
+        inner_bit_combos = gospers.bit_combos_gospers_pruned(
+            inner_length, inner_dotcount, feasible, skipped)
+        try:
+            for bit_combo in inner_bit_combos:
+                yield (bit_combo << low) | given_bits
+        finally:
+            label = 'bit_combos_pruned({}, {})'.format(distance,
+                                                       dotcount)
+            self.log_skipped(label, skipped[0], start_time)
+        # }}}
+
+
+    def log_skipped(self, label, count, start_time):
+        # {{{
+        """
+        Log and record in stats how many combos a pruning generator
+        skipped without generating them, with log_progress()'s
+        stats format.  Accumulates if label was already used.
+        """
+        timestamp = time.time()
+        if label in self.stats:
+            count += self.stats[label]['count']
+            start_time -= self.stats[label]['elapsed']
+        self.stats[label] = {
+            'count': count,
+            'elapsed': timestamp - start_time,
+            'timestamp': timestamp }
+        logger.debug('{:>30}  skipped {:,d} so far'.format(
+                     label,
+                     count))
+        # }}}
+
+
+    def bit_prefix_measures(self, bit_combo):
+        # {{{
+        """
+        Bitmask of the distances a bitwise combo measures, with bit n
+        set if there are dots n apart.  Goes dot by dot, so it is
+        quicker than checking every distance for combos with few dots.
+        """
+        measured = 0
+        remaining = bit_combo
+        while remaining:
+            lowest = remaining & -remaining
+            measured |= bit_combo >> (lowest.bit_length() - 1)
+            remaining ^= lowest
+        return measured & ~1
+        # }}}
+
+
+    def bit_prefix_can_measure(self, bit_combo, measured, needed,
+                               free, limit, low=1):
+        # {{{
+        """
+        Returns False if a partial bitwise combo cannot possibly be
+        completed into one that measures every distance in needed.
+        bit_combo has the dots placed so far, none of them from low
+        up to (not including) limit, measured is the bitmask of
+        distances those dots measure, and free more dots may still go
+        from low up to limit.  By default that is strictly between 0
+        and limit, for dots placed from the top down.
+        Returns True if it might still work out (no guarantees).
+        """
+        missing = needed & ~measured
+        if not missing:
+            return True
+        if not free:
+            return False
+
+        # Counting bound: each new dot pairs with every dot placed
+        # so far and with every other new dot, measuring at most
+        # that many new distances.
+        placed = _util.bit_count(bit_combo)
+        if _util.bit_count(missing) > (free * placed
+                                       + free * (free - 1) // 2):
+            return False
+
+        # Distances of limit - low or more are too long to be between
+        # two new dots, so they need pairs with placed dots.
+        width = limit - low
+        if _util.bit_count(missing >> width) > free * placed:
+            return False
+
+        # Range bound: a new dot x, low <= x < limit, can only measure
+        # distances from x to placed dots y, or differences between
+        # new dots, which are all < limit - low.
+        band = (1 << width) - 1
+        reachable = (band >> 1) << 1
+        remaining = bit_combo
+        while remaining:
+            lowest = remaining & -remaining
+            position = lowest.bit_length() - 1
+            if position >= limit:
+                reachable |= band << (position - limit + 1)
+            else:
+                reachable |= band << (low - position)
+            remaining ^= lowest
+        return not (missing & ~reachable)
+        # }}}
+
+
+    def givens_fit(self, distance, dotcount, leading=(), trailing=()):
+        # {{{
+        """
+        True if bit_combos_with_givens() would generate any combos,
+        that is, if the given bits fit within distance + 1 positions
+        and leave a possible number of dots for the positions between.
+        """
+        inner_length = distance + 1 - len(leading) - len(trailing)
+        inner_dotcount = dotcount - sum(leading) - sum(trailing)
+        return inner_length >= 0 and 0 <= inner_dotcount <= inner_length
+        # }}}
+
+
+    def canonical_givens(self, distance):
+        # {{{
+        """
+        Leading and trailing givens covering every combo that is
+        canonical, as in no larger than its mirror image, AND that
+        could measure distance - 1.  Measuring distance - 1 takes
+        a dot at 1 or at distance - 1.  Combos with a dot at only
+        one of those are mirror images of each other, so we keep the
+        ones with a dot at 1 and not at distance - 1.  Combos with
+        both are their own family, mirror images of each other, so
+        bit_combo_is_canonical() must still weed out half of those.
+        Only meaningful for distance >= 3, where 1 != distance - 1.
+        """
+        return (((1, 0), (1, 1)),   # dot at 1, not at distance - 1
+                ((1, 1), (1, 1)))   # dots at both 1 and distance - 1
+        # }}}
+
+
+    def compatible_outer_patterns(self, width):
+        # {{{
+        """
+        Map each left outer pattern to the right outer patterns that
+        together measure the largest width distances, that is, for
+        every j below width there are dots l and r with l + r = j.
+        An outer pattern is the dots in the width positions at one
+        end of a combo, as bits counting in from that end.  Both
+        patterns always include their own endpoint, bit 0.
+        """
+        full = (1 << width) - 1
+        patterns = range(1, 1 << width, 2)
+        compatible = dict()
+        for left in patterns:
+            compatible[left] = []
+            for right in patterns:
+                sums = 0
+                for position in range(width):
+                    if left & (1 << position):
+                        sums |= right << position
+                if sums & full == full:
+                    compatible[left].append(right)
+        return compatible
+        # }}}
+
+
+    def top_families(self, distance, width, canonical=False):
+        # {{{
+        """
+        Given bits for every family of combos that measure the
+        largest width distances, distance down to distance - width + 1.
+        Dots l from the left end and r from the right end measure
+        distance - (l + r), so only dots in the outer width positions
+        at each end can measure those, and each compatible pair of
+        outer patterns is a family.  Canonical drops the families
+        whose mirror image family sorts lower, leaving the rest to
+        bit_combo_is_canonical().
+        Returns a list of given bits, combos in each family have
+        those dots and none at the other outer positions.
+        """
+        families = []
+        high = distance - width + 1
+        compatible = self.compatible_outer_patterns(width)
+        for left in sorted(compatible):
+            for right in compatible[left]:
+                # Right patterns count in from the right end.
+                mirrored = _util.mirror_bits(right, width - 1)
+                if canonical and mirrored > _util.mirror_bits(
+                        left, width - 1):
+                    continue
+                families.append(left | (mirrored << high))
+        return families
+        # }}}
+
+
+    def covering_families(self, distance, width=None, canonical=False):
+        # {{{
+        """
+        The top_families() bit_combos_covering_top() builds combos
+        from, as (width, families), with width (self.top_width by
+        default) cut down so the outer patterns at each end do not
+        overlap.  Width 1 is the single family with both endpoints.
+        """
+        if width is None:
+            width = self.top_width
+        width = min(width, (distance + 1) // 2)
+        if width < 2:
+            return 1, [(1 << distance) | 1]
+        return width, self.top_families(distance, width, canonical)
+        # }}}
+
+
+    def bit_combos_covering_top(self, distance, dotcount, width=None,
+                                canonical=False, start=0, progress=None):
+        # {{{
+        """
+        Bitwise combos with dotcount dots that measure at least the
+        largest width distances (self.top_width by default), built
+        family by family from top_families() instead of generating
+        every combo with both endpoints and filtering.  Not in
+        increasing integer order overall, only within each family.
+        Records how many bit_combos_with_ends() combos got skipped.
+        Starts at family index start, and if given, calls progress
+        with the index of the next family when asked for a combo
+        from it, after every combo before it has been dealt with.
+        """
+        width, families = self.covering_families(distance, width,
+                                                 canonical)
+        if width < 2:
+            if start < 1:
+                for bit_combo in self.bit_combos_with_ends(
+                        distance, dotcount, self.prune_prefixes):
+                    yield bit_combo
+                if progress is not None:
+                    progress(1)
+            return
+
+        inner_length = distance + 1 - 2 * width
+        start_time = time.time()
+        generated = 0
+        for index, given_bits in enumerate(families):
+            inner_dotcount = dotcount - _util.bit_count(given_bits)
+            if not 0 <= inner_dotcount <= inner_length:
+                continue
+            generated += _util.combinations_count(range(inner_length),
+                                                  inner_dotcount)
+            if index < start:
+                continue
+            if self.prune_prefixes:
+                combos = self.bit_combos_pruned(
+                    distance, dotcount, given_bits, width, inner_length)
+            else:
+                combos = (
+                    (inner << width) | given_bits
+                    for inner in gospers.bit_combos_gospers(
+                        inner_length, inner_dotcount))
+            for bit_combo in combos:
+                yield bit_combo
+            if progress is not None:
+                progress(index + 1)
+
+        every = _util.combinations_count(range(distance - 1),
+                                         dotcount - 2)
+        label = 'bit_combos_covering_top({}, {}) skipped'.format(
+            distance, dotcount)
+        self.log_skipped(label, every - generated, start_time)
+        # }}}
+
+
+    def bit_combo_is_canonical(self, bitcombo, distance):
+        # {{{
+        """
+        True if bitcombo is no larger than its mirror image, that is,
+        than the same combo flipped end to end over distance.
+        """
+        return bitcombo <= _util.mirror_bits(bitcombo, distance)
+        # }}}
+
+
+    def bit_combos_with_mirrors(self, bitcombos, distance):
+        # {{{
+        """
+        Rebuild mirror image twins of canonical combos, returning
+        combos and twins together in increasing integer order, the
+        same order the non-canonical search would produce them in.
+        """
+        bitcombos = set(bitcombos)
+        mirrors = set(_util.mirror_bits(bc, distance) for bc in bitcombos)
+        return sorted(bitcombos | mirrors)
+        # }}}
 
 
     def best_combos(self, distance):
@@ -132,13 +544,13 @@ class HolesBitwise(_base.HolesBase):
         # {{{
         found_one = False
 
-        # distance+1 positions, inclusive on both ends, +1 for range()
-        for dotcount in range(2, distance + 2):
-            combos = self.bit_combos_with_ends(distance, dotcount)
-            label = 'bit_combos_with_ends({}, {})'.format(distance,
-                                                          dotcount)
-            combos = self.log_progress(combos, label, 100000000)
-            combos = self.bit_combos_that_measure(combos, distance)
+        # Fewest dots first, 2 through distance + 1 unless bounded.
+        for dotcount in self.dotcount_range(distance):
+            self.checkpoint_dotcount(distance, dotcount)
+            combos = self.good_bit_combos(distance, dotcount)
+            # Any canonical combo will do as the one found.
+            if self.canonical and self.mode != 'one':
+                combos = self.bit_combos_with_mirrors(combos, distance)
             for c in combos:
                 # Don't keep looking at longer dotcounts.
                 found_one = True
@@ -152,6 +564,181 @@ class HolesBitwise(_base.HolesBase):
         # }}}
 
 
+    def good_bit_combos(self, distance, dotcount):
+        # {{{
+        """
+        Bitwise combos with dotcount dots, including both endpoints,
+        that measure distance.  In canonical mode, only the canonical
+        one of each mirror image pair.  Resumes from a checkpoint's
+        position, a count of families, if there is one.
+        """
+        position, saved, count = self.checkpoint_resume(distance,
+                                                        dotcount)
+        combos = self.candidate_bit_combos(distance, dotcount,
+                                           position or 0)
+        combos = self.bit_combos_that_measure(combos, distance)
+        if self.canonical:
+            combos = (c for c in combos
+                      if self.bit_combo_is_canonical(c, distance))
+        combos = self.checkpointed(combos, distance, dotcount)
+        # Families come out one after another, so put the good combos
+        # back in increasing integer order.
+        return self.in_order(itertools.chain(saved, combos))
+        # }}}
+
+
+    def candidate_bit_combos(self, distance, dotcount, start=0):
+        # {{{
+        """
+        Bitwise combos good_bit_combos() filters for those that
+        measure distance, see bit_combos_covering_top(), starting
+        at family index start, reporting progress to the checkpoint.
+        """
+        progress = functools.partial(self.checkpoint_progress, distance,
+                                     dotcount)
+        combos = self.bit_combos_covering_top(distance, dotcount,
+                                              canonical=self.canonical,
+                                              start=start,
+                                              progress=progress)
+        label = 'bit_combos_covering_top({}, {})'.format(distance,
+                                                         dotcount)
+        return self.log_progress(combos, label, 100000000)
+        # }}}
+
+
+    def in_order(self, bit_combos, unique=False):
+        # {{{
+        """
+        Sort bitwise combos into increasing integer order, dropping
+        repeats if unique.  In find-one and count-only modes, order
+        does not matter, so they get the iterator as is, unless
+        repeats must be dropped to count right.
+        """
+        if self.mode == 'one':
+            return bit_combos
+        if unique:
+            bit_combos = set(bit_combos)
+        if self.mode == 'count':
+            return bit_combos
+        return sorted(bit_combos)
+        # }}}
+
+
+    def count_best_combos(self, distance):
+        # {{{
+        """
+        Count-only version of best_combos(), see HolesBase.
+        Counts dotcount by dotcount with count_good_bit_combos(),
+        stopping at the first dotcount with any good combos.
+        """
+        for dotcount in self.dotcount_range(distance):
+            self.checkpoint_dotcount(distance, dotcount)
+            count = self.count_good_bit_combos(distance, dotcount)
+            if count:
+                return dotcount, count
+        return None, 0
+        # }}}
+
+
+    def checkpoint_dotcount(self, distance, dotcount):
+        # {{{
+        # Tell the checkpoint, if any, the search is on dotcount.
+        if self.checkpoint is not None:
+            self.checkpoint.begin(distance, dotcount)
+        # }}}
+
+
+    def checkpoint_resume(self, distance, dotcount):
+        # {{{
+        """
+        (position, bit_combos, count) to resume the search for good
+        combos with dotcount dots from, see checkpoint.py, or
+        (None, [], 0) to start at the beginning.
+        """
+        if self.checkpoint is None:
+            return None, [], 0
+        return self.checkpoint.resume(distance, dotcount)
+        # }}}
+
+
+    def checkpoint_found(self, distance, dotcount, bit_combos=(),
+                         count=0):
+        # {{{
+        # Tell the checkpoint, if any, about good combos found.
+        if self.checkpoint is not None:
+            self.checkpoint.found(distance, dotcount, bit_combos, count)
+        # }}}
+
+
+    def checkpoint_progress(self, distance, dotcount, position):
+        # {{{
+        # Tell the checkpoint, if any, the search is at position.
+        if self.checkpoint is not None:
+            self.checkpoint.progress(distance, dotcount, position)
+        # }}}
+
+
+    def checkpointed(self, bit_combos, distance, dotcount):
+        # {{{
+        """
+        bit_combos, telling the checkpoint, if any, about each one
+        as it goes by.  In count-only mode, the checkpoint just gets
+        told how many, counting mirror images like
+        count_good_bit_combos(), so it never keeps the combos.
+        """
+        if self.checkpoint is None:
+            return bit_combos
+        return self._checkpointed(bit_combos, distance, dotcount)
+
+    def _checkpointed(self, bit_combos, distance, dotcount):
+        for bit_combo in bit_combos:
+            if self.mode != 'count':
+                self.checkpoint.found(distance, dotcount, (bit_combo,))
+            elif self.canonical:
+                self.checkpoint.found(distance, dotcount,
+                    count=self.count_with_mirrors((bit_combo,), distance))
+            else:
+                self.checkpoint.found(distance, dotcount, count=1)
+            yield bit_combo
+        # }}}
+
+
+    def count_good_bit_combos(self, distance, dotcount):
+        # {{{
+        """
+        How many good_bit_combos() there are, including mirror
+        images in canonical mode, without keeping any of them.
+        Resuming from a checkpoint, the count so far comes from it.
+        """
+        position, saved, count = self.checkpoint_resume(distance,
+                                                        dotcount)
+        combos = self.good_bit_combos(distance, dotcount)
+        if self.canonical:
+            return count + self.count_with_mirrors(combos, distance)
+        for count, bit_combo in enumerate(combos, start=count + 1):
+            pass
+        return count
+        # }}}
+
+
+    def count_with_mirrors(self, bit_combos, distance):
+        # {{{
+        """
+        How many combos canonical bit_combos stand for, counting
+        each twice, for it and its mirror image, unless it is its
+        own mirror image.  Combos that are not canonical count 0.
+        """
+        count = 0
+        for bit_combo in bit_combos:
+            mirror = _util.mirror_bits(bit_combo, distance)
+            if bit_combo < mirror:
+                count += 2
+            elif bit_combo == mirror:
+                count += 1
+        return count
+        # }}}
+
+
     def bit_combos_that_measure(self, bitcombos, distance):
         # {{{
         "Filters for combos that measure distance."
@@ -165,6 +752,18 @@ class HolesBitwise(_base.HolesBase):
         # }}}
 
 
+    def count_bit_combos_that_measure(self, bitcombos, distance):
+        # {{{
+        "How many of bitcombos measure distance."
+        count = 0
+        for count, bitcombo in enumerate(
+                self.bit_combos_that_measure(bitcombos, distance),
+                start=1):
+            pass
+        return count
+        # }}}
+
+
     def bit_combo_measures(self, bitcombo, distance):
         # {{{
         """
@@ -0,0 +1,122 @@
+# {{{ vim fold marker for module-level doctext
+"""
+This module finds the minimum number of dots/ticks on a straightedge,
+or HOLES in a template, such that you can still mark out any integer
+length up the total length using pairs of the tick marks/dots/holes.
+
+This implementation of the holes base class uses BRANCH-and-bound
+backtracking on bitwise combos.  Instead of generating every combo
+and filtering afterwards, it places dots one at a time, keeping a
+running bitmask of the distances measured so far, and abandons a
+partial combo as soon as the dots still allowed cannot possibly
+measure the distances still missing.
+"""
+# }}}
+
+
+import logging  # {{{
+from . import _base
+from . import _util
+from . import bitbased
+
+__version__ = _util.__version__
+__all__ = []
+
+logger = _util.logger
+# }}}
+
+
+class HolesBranchBound(bitbased.HolesBitwise):
+    # {{{
+    # {{{
+    """
+    Holes class implemented with branch-and-bound backtracking.
+    It is descended from HolesBitwise, so combos are bitwise integers
+    internally, and best_combos() returns the same combos in the same
+    order as HolesBitwise, just without visiting most of them.
+    """
+    # Dots get placed from the distance endpoint downward, trying the
+    # lowest position first at each level.  That visits combos in
+    # increasing integer order, the same order gospers produces.
+    # }}}
+
+
+    implementation_key = 'branch'
+    implementation_name = 'branch-and-bound bitwise implementation'
+
+    def __init__(self):
+        super().__init__()
+
+
+    def good_bit_combos(self, distance, dotcount):
+        # {{{
+        """
+        Bitwise combos with dotcount dots, including both endpoints,
+        that measure distance, found by backtracking instead of
+        generating and filtering them.
+        """
+        combos = self.bit_combos_branched(distance, dotcount)
+        label = 'bit_combos_branched({}, {})'.format(distance, dotcount)
+        return self.log_progress(combos, label, 1000)
+        # }}}
+
+
+    def bit_combos_branched(self, distance, dotcount):
+        # {{{
+        """
+        All bitwise combos with dotcount dots, including both
+        endpoints, which measure every distance 1 through distance.
+        Combos are yielded in increasing integer order.
+        """
+        if distance < 1 or dotcount < 2 or dotcount > distance + 1:
+            return
+
+        # Bit n of a "measured" bitmask means distance n is measured.
+        needed = (1 << (distance + 1)) - 2
+        bit_combo = (1 << distance) | 1
+        measured = 1 << distance
+
+        # Replace yield from for Python 3.2 compatibility.
+        for bit_combo in self._add_dots(bit_combo, measured, needed,
+                                        dotcount - 2, distance):
+            yield bit_combo
+        # }}}
+
+
+    def _add_dots(self, bit_combo, measured, needed, free, limit):
+        # {{{
+        """
+        Recursively place the highest of free remaining dots
+        somewhere strictly between 0 and limit, the lowest dot
+        placed so far other than 0.
+        """
+        if free == 0:
+            if measured == needed:
+                yield bit_combo
+            return
+
+        # The free - 1 dots after this one need positions below it.
+        for position in range(free, limit):
+            # Every placed dot is above position except for dot 0,
+            # so shifting the combo right by position lines each of
+            # them up with its distance from the new dot.
+            new_measured = (measured
+                            | (bit_combo >> position)
+                            | (1 << position))
+            new_combo = bit_combo | (1 << position)
+            if not self.bit_prefix_can_measure(new_combo,
+                                               new_measured,
+                                               needed,
+                                               free - 1,
+                                               position):
+                continue
+            for c in self._add_dots(new_combo, new_measured, needed,
+                                    free - 1, position):
+                yield c
+        # }}}
+
+
+    # }}} end of vim class fold
+
+
+_base.register_implementation(HolesBranchBound)
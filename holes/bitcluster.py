@@ -0,0 +1,603 @@
+# {{{ vim fold marker for module-level doctext
+"""
+This module finds the minimum number of dots/ticks on a straightedge,
+or HOLES in a template, such that you can still mark out any integer
+length up the total length using pairs of the tick marks/dots/holes.
+
+This implementation of the holes base class spreads a search across
+a CLUSTER of worker processes, which can be on other machines.
+The holes instance is the coordinator.  It listens on a TCP address,
+and workers connect to it, from run_worker() here or holey.py -e.
+It splits each search into tasks by given leading and trailing bits,
+the same way bitparallel.py does, and hands them out one at a time
+to whichever workers are idle.  Good combos stream back in batches.
+
+Each task handed out is a lease, which the worker renews with every
+batch, and between chunks now and then while it finds nothing.  If
+its worker disconnects, or the lease runs out anyway, the task goes
+to another worker.  Tasks always find the same combos in the same
+order, so the retry just skips the combos already received, and
+whichever worker finishes the task first finishes it.  Workers get
+told to stop tasks that nobody wants any more.
+
+Messages are pickled, so whoever knows the authkey can run code on
+the coordinator and its workers.  It comes from the HOLES_AUTHKEY
+environment variable, which has to be set, to a secret shared only
+with the workers, to listen anywhere but loopback, or to run a
+worker.  Without it, a coordinator listening on loopback makes up a
+random authkey, which only its own local workers get.
+"""
+# }}}
+
+
+import logging  # {{{
+import os
+import time
+import ipaddress
+import heapq
+import collections
+import queue
+import socket
+import threading
+import traceback
+import multiprocessing
+from multiprocessing.connection import Listener, Client, wait
+from multiprocessing import AuthenticationError
+from . import _base
+from . import _util
+from . import bitparallel
+
+__version__ = _util.__version__
+__all__ = []
+
+logger = _util.logger
+# }}}
+
+
+def default_authkey():
+    # The key shared by the coordinator and its workers, or None.
+    authkey = os.environ.get('HOLES_AUTHKEY')
+    return authkey.encode() if authkey else None
+
+
+def is_loopback(host):
+    # {{{
+    # True if host is only reachable from this machine.
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+    # }}}
+
+
+def no_delay(conn):
+    # {{{
+    # Messages are small and go back and forth, so send them right
+    # away instead of waiting on acks to batch them up (Nagle).
+    sock = socket.fromfd(conn.fileno(), socket.AF_INET,
+                         socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    finally:
+        sock.close()
+    return conn
+    # }}}
+
+
+class HolesBitwiseCluster(bitparallel.HolesBitwiseParallel):
+
+    implementation_key = 'cluster'
+    implementation_name = 'cluster of bitwise numpy workers over TCP'
+
+    def __init__(self):
+        super().__init__()
+        # Where the coordinator listens.  Port 0 picks a free port,
+        # which is fine for workers started here, see local_workers.
+        self.address = ('localhost', 0)
+        # None makes up a random one, for listening on loopback only.
+        self.authkey = default_authkey()
+        # Worker processes to start on this machine along with the
+        # coordinator.  Use 0 to only have workers that connect.
+        self.local_workers = 2
+        # Seconds a worker can go without a word, results or saying
+        # it is still at it, before its task goes to another worker.
+        self.lease_seconds = 600
+        self._coordinator = None
+
+
+    def close(self):
+        # {{{
+        """
+        Stop the coordinator, telling connected workers to stop and
+        waiting for the local ones to finish.
+        """
+        if self._coordinator is not None:
+            self._coordinator.close()
+            self._coordinator = None
+        super().close()
+        # }}}
+
+
+    def coordinator(self):
+        # {{{
+        """
+        The Coordinator for this instance, started the first time
+        it is needed, along with any local workers.  Raises
+        ValueError if it would listen beyond loopback without an
+        authkey, see default_authkey().
+        """
+        if self._coordinator is None:
+            if self.authkey is None:
+                if not is_loopback(self.address[0]):
+                    raise ValueError(
+                        'Set HOLES_AUTHKEY to a shared secret to listen '
+                        'on {}, anyone who can connect can run code '
+                        'here'.format(self.address[0]))
+                self.authkey = os.urandom(32)
+            self._coordinator = Coordinator(self.address, self.authkey)
+            self._coordinator.start_local_workers(self.local_workers)
+        self._coordinator.lease_seconds = self.lease_seconds
+        return self._coordinator
+        # }}}
+
+
+    def parallelize_good_combos(self, distance, dotcount):
+        # {{{
+        """
+        bitparallel.py's parallelize_good_combos(), with the tasks
+        going to cluster workers instead of a pool.  Tasks are split
+        for about self.parallels workers, but any number can help.
+        """
+        givens = self.partition_givens(distance, dotcount)
+        settings = self.worker_settings(distance)
+        tasks = [(settings, distance, dotcount, leading, trailing)
+                 for leading, trailing in givens]
+        label = 'cluster_checked({}, {})'.format(distance, dotcount)
+
+        if self.mode == 'one':
+            return self.cluster_first_good_combo(tasks, label)
+
+        if self.mode == 'count':
+            start_time = time.time()
+            results = [None] * len(tasks)
+            for index, kind, payload in self.coordinator().results(tasks):
+                if kind == 'done':
+                    results[index] = payload
+            self.log_cluster_results(results, label, start_time)
+            return sum(count for count, checked in results)
+
+        return self.cluster_merged_good_combos(tasks, label)
+        # }}}
+
+
+    def cluster_merged_good_combos(self, tasks, label=None):
+        # {{{
+        """
+        Good combos from all the tasks, merged into increasing order
+        as they arrive, like bitparallel.py's
+        parallelize_merged_good_combos().
+        """
+        start_time = time.time()
+        events = self.coordinator().results(tasks)
+        buffers = [collections.deque() for task in tasks]
+        results = [None] * len(tasks)
+
+        def task_combos(index):
+            buffer = buffers[index]
+            while True:
+                while buffer:
+                    yield buffer.popleft()
+                if results[index] is not None:
+                    return
+                event_index, kind, payload = next(events)
+                if kind == 'done':
+                    results[event_index] = payload
+                else:
+                    buffers[event_index].extend(payload)
+
+        try:
+            streams = [task_combos(index) for index in range(len(tasks))]
+            # Replace yield from for Python 3.2 compatibility.
+            for combo in heapq.merge(* streams):
+                yield combo
+        finally:
+            # Stopping early leaves workers finishing tasks nobody
+            # wants, which the coordinator ignores.
+            events.close()
+            self.log_cluster_results(results, label, start_time)
+        # }}}
+
+
+    def cluster_first_good_combo(self, tasks, label=None):
+        # {{{
+        """
+        Find-one version of parallelize_good_combos(), returning a
+        list with the first good combo any worker finds, or an empty
+        list if none of them find one.
+        """
+        start_time = time.time()
+        events = self.coordinator().results(tasks)
+        results = [None] * len(tasks)
+        try:
+            for index, kind, payload in events:
+                if kind == 'done':
+                    results[index] = payload
+                elif payload:
+                    return [payload[0]]
+            return []
+        finally:
+            events.close()
+            self.log_cluster_results(results, label, start_time)
+        # }}}
+
+
+    def log_cluster_results(self, results, label, start_time):
+        # {{{
+        """
+        Log how many combos the finished tasks checked, and record
+        it in stats under label, in log_progress() style.
+        """
+        elapsed = time.time() - start_time
+        finished = [result for result in results if result is not None]
+        checked = sum(checked for found, checked in finished)
+        logger.debug('{:>30}  checked {:,d}, {} of {} tasks'
+                     ' in {:.6f} sec'.format(label, checked,
+                                             len(finished), len(results),
+                                             elapsed))
+        self.stats[label] = {
+                 'count': checked,
+                 'elapsed': elapsed,
+                 'timestamp': time.time() }
+        # }}}
+
+
+class Coordinator(object):
+    # {{{
+    """
+    Listens for workers on a TCP address, and hands them tasks.
+    Workers stay connected between searches, idle or busy with one
+    task at a time, until the coordinator closes or they disconnect.
+    """
+    # Messages are tuples.  To a worker:
+    #   ('task', (search, index), task, lease_seconds)
+    #                                    - run task, see run_worker()
+    #   ('cancel', (search, index))      - stop the task, if still on it
+    #   ('stop',)                        - disconnect and exit
+    # From a worker, about the task it was last sent:
+    #   ('combos', (search, index), combos)
+    #   ('alive', (search, index), checked) - still on it, between chunks
+    #   ('done', (search, index), (found, checked))
+    #   ('cancelled', (search, index), None)
+    #   ('error', (search, index), traceback text)
+
+    def __init__(self, address, authkey):
+        self.authkey = authkey
+        self.lease_seconds = 600
+        # How long to wait for messages before checking on leases
+        # and newly connected workers.
+        self.poll_seconds = 0.1
+        self.listener = Listener(tuple(address), authkey=authkey)
+        self.address = self.listener.address
+        self._search_id = 0
+        self._closing = False
+        self._processes = []
+        # Workers connected, by connection.  Each is busy with the
+        # (search, index) of its task, or None when idle.
+        self._workers = collections.OrderedDict()
+        self._connected = queue.Queue()
+        self._accepter = None
+        logger.info('Coordinator listening on {}:{}'.format(
+                    * self.address))
+
+
+    def start_local_workers(self, count):
+        # {{{
+        """
+        Start count worker processes on this machine, connecting
+        like any other worker would.  Call this before the first
+        search, since forking is best done with no threads running.
+        """
+        for _ in range(count):
+            process = multiprocessing.Process(
+                target=run_worker, args=(self.address, self.authkey),
+                daemon=True)
+            process.start()
+            self._processes.append(process)
+        # }}}
+
+
+    def _accept(self):
+        # {{{
+        # Runs in a thread, accepting workers until closing.
+        while True:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                logger.warning('Worker failed authentication')
+                continue
+            except OSError:
+                return
+            if self._closing:
+                conn.close()
+                return
+            self._connected.put(no_delay(conn))
+        # }}}
+
+
+    def _take_connected(self):
+        # Move workers the accept thread connected into _workers.
+        if self._accepter is None:
+            self._accepter = threading.Thread(target=self._accept,
+                                              daemon=True)
+            self._accepter.start()
+        while True:
+            try:
+                conn = self._connected.get_nowait()
+            except queue.Empty:
+                return
+            self._workers[conn] = None
+            logger.debug('Worker connected, {} workers'.format(
+                         len(self._workers)))
+
+
+    def _drop(self, conn):
+        # Forget a worker, returning the task it was busy with.
+        task_id = self._workers.pop(conn, None)
+        conn.close()
+        logger.info('Worker disconnected, {} workers'.format(
+                    len(self._workers)))
+        return task_id
+
+
+    def results(self, tasks):
+        # {{{
+        """
+        Run tasks on the workers, yielding (index, 'combos', combos)
+        as batches of good combos arrive, and (index, 'done',
+        (found, checked)) when a task finishes.  Each task's batches
+        come in order, with no repeats, even if it had to be retried.
+        Waits for workers to connect if there are none.  A task
+        whose workers all go lease_seconds without a word goes to
+        another worker as well, and whichever of them finishes it
+        first does, the rest getting cancelled, like any tasks still
+        running when the search is over.
+        """
+        self._search_id += 1
+        search = self._search_id
+        pending = collections.deque(range(len(tasks)))
+        # How many combos each task has yielded, so batches from any
+        # of its workers skip those already seen.
+        accepted = [0] * len(tasks)
+        # For each task, the workers running it, with how many combos
+        # each has sent, and when its lease runs out, unless one of
+        # them says something first.
+        runners = [dict() for task in tasks]
+        deadlines = dict()
+        finished = [False] * len(tasks)
+        remaining = len(tasks)
+
+        try:
+            while remaining:
+                self._take_connected()
+                idle = [conn for conn, task_id in self._workers.items()
+                        if task_id is None]
+                while pending and idle:
+                    index = pending.popleft()
+                    if finished[index]:
+                        continue
+                    conn = idle.pop(0)
+                    try:
+                        conn.send(('task', (search, index), tasks[index],
+                                   self.lease_seconds))
+                    except OSError:
+                        self._drop(conn)
+                        pending.appendleft(index)
+                        continue
+                    self._workers[conn] = (search, index)
+                    runners[index][conn] = 0
+                    deadlines[index] = time.time() + self.lease_seconds
+
+                for conn in wait(list(self._workers), self.poll_seconds):
+                    try:
+                        kind, task_id, payload = conn.recv()
+                    except (EOFError, OSError):
+                        task_id = self._drop(conn)
+                        if task_id is not None and task_id[0] == search:
+                            self._lost_runner(task_id[1], conn, runners,
+                                              finished, pending, deadlines)
+                        continue
+                    if kind not in ('combos', 'alive'):
+                        self._workers[conn] = None
+                    # Anything else is about a task from an earlier
+                    # search, or one another worker already finished.
+                    index = task_id[1]
+                    if (task_id[0] != search or finished[index]
+                            or conn not in runners[index]):
+                        continue
+                    if index not in pending:
+                        deadlines[index] = time.time() + self.lease_seconds
+                    if kind == 'combos':
+                        sent = runners[index][conn]
+                        runners[index][conn] = sent + len(payload)
+                        payload = payload[max(accepted[index] - sent, 0):]
+                        if payload:
+                            accepted[index] += len(payload)
+                            yield index, kind, payload
+                    elif kind == 'done':
+                        finished[index] = True
+                        remaining -= 1
+                        del runners[index][conn]
+                        deadlines.pop(index, None)
+                        for other in runners[index]:
+                            self._cancel(other, task_id)
+                        runners[index].clear()
+                        yield index, kind, payload
+                    elif kind == 'cancelled':
+                        self._lost_runner(index, conn, runners, finished,
+                                          pending, deadlines)
+                    elif kind == 'error':
+                        raise RuntimeError('Cluster worker failed on task '
+                                           '{}:\n{}'.format(index, payload))
+                    # 'alive' just renews the lease.
+
+                now = time.time()
+                for index, deadline in list(deadlines.items()):
+                    if now > deadline:
+                        logger.info('Lease on task {} ran out, retrying'
+                                    .format(index))
+                        del deadlines[index]
+                        pending.appendleft(index)
+        finally:
+            # Nobody wants what the workers still on this search's
+            # tasks would find, so they can move on to the next one.
+            for index, conns in enumerate(runners):
+                for conn in conns:
+                    self._cancel(conn, (search, index))
+        # }}}
+
+
+    def _lost_runner(self, index, conn, runners, finished, pending,
+                     deadlines):
+        # {{{
+        # A worker stopped running task index, without finishing it.
+        # If none are left on it, it goes back at the front of the
+        # line, unless it is finished or already waiting there.
+        runners[index].pop(conn, None)
+        if finished[index] or runners[index] or index in pending:
+            return
+        deadlines.pop(index, None)
+        pending.appendleft(index)
+        # }}}
+
+
+    def _cancel(self, conn, task_id):
+        # {{{
+        # Tell a worker to stop the task, and say 'cancelled', unless
+        # it is already done.  A worker that went away turns up when
+        # its connection is next read.
+        try:
+            conn.send(('cancel', task_id))
+        except OSError:
+            pass
+        # }}}
+
+
+    def close(self):
+        # {{{
+        """
+        Stop accepting workers, tell connected ones to stop, and
+        wait a little while for the local ones to exit.
+        """
+        self._closing = True
+        if self._accepter is not None:
+            # Wake the accept thread with one last connection.
+            try:
+                Client(self.address, authkey=self.authkey).close()
+            except OSError:
+                pass
+            self._accepter.join()
+        self.listener.close()
+        self._take_connected()
+        for conn in list(self._workers):
+            try:
+                conn.send(('stop',))
+            except OSError:
+                pass
+            conn.close()
+        self._workers.clear()
+        for process in self._processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._processes = []
+        # }}}
+    # }}}
+
+
+def run_worker(address, authkey=None):
+    # {{{
+    """
+    Connect to the coordinator at address, (host, port), and run
+    the tasks it sends until it says to stop or disconnects.
+    Between chunks, a task lets the coordinator know it is still
+    at it, a few times a lease, and stops if it has been cancelled.
+    Raises ValueError if there is no authkey, see default_authkey().
+    """
+    if authkey is None:
+        authkey = default_authkey()
+    if authkey is None:
+        raise ValueError('Set HOLES_AUTHKEY to the coordinator\'s '
+                         'shared secret to run a worker')
+    conn = no_delay(Client(tuple(address), authkey=authkey))
+    holes = HolesBitwiseCluster()
+    checked = 0
+    task_id = None
+    heartbeat = 0
+    last_sent = 0
+    stopping = False
+
+    def tally(count):
+        nonlocal checked
+        checked += count
+
+    def cancelled():
+        # Called between chunks.
+        nonlocal last_sent, stopping
+        if time.time() - last_sent >= heartbeat:
+            conn.send(('alive', task_id, checked))
+            last_sent = time.time()
+        while conn.poll():
+            message = conn.recv()
+            if message[0] == 'stop':
+                stopping = True
+                return True
+            if message[0] == 'cancel' and message[1] == task_id:
+                return True
+        return False
+
+    holes.tally = tally
+    holes.cancelled = cancelled
+    try:
+        while not stopping:
+            message = conn.recv()
+            if message[0] == 'stop':
+                return
+            if message[0] == 'cancel':
+                # For a task already done.
+                continue
+            kind, task_id, task, lease_seconds = message
+            settings, distance, dotcount, lead, trail = task
+            for name, value in settings.items():
+                setattr(holes, name, value)
+            checked = 0
+            heartbeat = lease_seconds / 4
+            last_sent = time.time()
+            try:
+                combos = holes.child_good_combos(distance, dotcount,
+                                                 lead, trail)
+                if holes.mode == 'count':
+                    found = combos
+                else:
+                    found = 0
+                    for batch in _util.chunkinate(combos,
+                                                  holes.result_batchsize):
+                        found += len(batch)
+                        conn.send(('combos', task_id, batch))
+                        last_sent = time.time()
+            except bitparallel.SearchCancelled:
+                conn.send(('cancelled', task_id, None))
+            except Exception:
+                conn.send(('error', task_id, traceback.format_exc()))
+            else:
+                conn.send(('done', task_id, (found, checked)))
+    except (EOFError, OSError):
+        # The coordinator went away.
+        return
+    finally:
+        conn.close()
+        holes.close()
+    # }}}
+
+
+_base.register_implementation(HolesBitwiseCluster)
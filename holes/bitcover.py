@@ -0,0 +1,191 @@
+# {{{ vim fold marker for module-level doctext
+"""
+This module finds the minimum number of dots/ticks on a straightedge,
+or HOLES in a template, such that you can still mark out any integer
+length up the total length using pairs of the tick marks/dots/holes.
+
+This implementation of the holes base class treats it as a COVER
+problem, in the spirit of Knuth's Dancing Links exact cover search.
+Every distance 1 through the total length must be covered by some
+pair of dots.  At each step it picks the uncovered distance with the
+fewest pairs of dots that could still cover it, and branches on
+those pairs, so the most constrained distances get decided first.
+"""
+# }}}
+
+
+import logging  # {{{
+import itertools
+from . import _base
+from . import _util
+from . import bitbased
+
+__version__ = _util.__version__
+__all__ = []
+
+logger = _util.logger
+# }}}
+
+
+class HolesExactCover(bitbased.HolesBitwise):
+    # {{{
+    # {{{
+    """
+    Holes class implemented as a distance-driven cover search.
+    It is descended from HolesBitwise, so combos are bitwise integers
+    internally, and best_combos() returns the same combos in the same
+    order as HolesBitwise.
+    """
+    # The search state is all bitmasks, passed down the recursion
+    # instead of being updated and undone, so backtracking is free:
+    #   dots      - dots placed so far, bit p for a dot at p
+    #   mirrored  - the same dots flipped, bit distance - p for p,
+    #               which lines up distances to dots below a new one
+    #   measured  - the index of covered distances, bit n if some
+    #               pair of dots placed so far is n apart
+    #   forbidden - positions an earlier sibling branch already
+    #               tried, so no combo gets found in two branches
+    # }}}
+
+
+    implementation_key = 'cover'
+    implementation_name = 'distance-driven cover search implementation'
+
+    def __init__(self):
+        super().__init__()
+
+
+    def good_bit_combos(self, distance, dotcount):
+        # {{{
+        """
+        Bitwise combos with dotcount dots, including both endpoints,
+        that measure distance, found by the cover search.
+        """
+        combos = self.bit_combos_covered(distance, dotcount)
+        label = 'bit_combos_covered({}, {})'.format(distance, dotcount)
+        combos = self.log_progress(combos, label, 1000)
+        # Branches covering a distance with two new dots can
+        # overlap, so drop repeats and restore integer order.
+        return self.in_order(combos, unique=True)
+        # }}}
+
+
+    def bit_combos_covered(self, distance, dotcount):
+        # {{{
+        """
+        Bitwise combos with dotcount dots, including both endpoints,
+        which measure every distance 1 through distance.  The same
+        combo may be yielded more than once, in no particular order.
+        """
+        if distance < 1 or dotcount < 2 or dotcount > distance + 1:
+            return
+
+        dots = (1 << distance) | 1
+        measured = 1 << distance
+        # Replace yield from for Python 3.2 compatibility.
+        for bit_combo in self._cover(distance, dots, dots, measured,
+                                     dotcount - 2, 0):
+            yield bit_combo
+        # }}}
+
+
+    def _cover(self, distance, dots, mirrored, measured, free,
+               forbidden):
+        # {{{
+        """
+        Recursively cover the uncovered distance with the fewest
+        candidate pairs, placing at most free more dots anywhere
+        not already dotted or forbidden.
+        """
+        full = (1 << (distance + 1)) - 1
+        missing = (full - 1) & ~measured
+        allowed = full & ~dots & ~forbidden
+
+        if not missing:
+            # Everything is covered, fill any spare dots in anywhere.
+            positions = [p for p in range(distance) if allowed & (1 << p)]
+            for extra in itertools.combinations(positions, free):
+                bit_combo = dots
+                for position in extra:
+                    bit_combo |= 1 << position
+                yield bit_combo
+            return
+        if not free:
+            return
+
+        # Counting bound: each new dot pairs with every dot placed
+        # so far and with every other new dot.
+        placed = _util.bit_count(dots)
+        if _util.bit_count(missing) > (free * placed
+                                       + free * (free - 1) // 2):
+            return
+
+        # Find the uncovered distance with the fewest candidate pairs.
+        # A pair covering spacing has one dot already placed and one
+        # new dot, or, with 2 or more dots left, two new dots.
+        best_spacing, best_count = None, None
+        for spacing in range(distance - 1, 0, -1):
+            if not missing & (1 << spacing):
+                continue
+            singles = ((dots >> spacing) | (dots << spacing)) & allowed
+            count = _util.bit_count(singles)
+            if free >= 2:
+                count += _util.bit_count(allowed & (allowed >> spacing))
+            if count == 0:
+                return
+            if best_count is None or count < best_count:
+                best_spacing, best_count = spacing, count
+                if count == 1:
+                    break
+
+        spacing = best_spacing
+        singles = ((dots >> spacing) | (dots << spacing)) & allowed
+        position = 0
+        while singles >> position:
+            if singles & (1 << position):
+                for c in self._add_cover(distance, dots, mirrored,
+                                         measured, free, forbidden,
+                                         (position,)):
+                    yield c
+                # Later siblings find the combos without this dot.
+                forbidden |= 1 << position
+            position += 1
+
+        if free >= 2:
+            allowed = full & ~dots & ~forbidden
+            pairs = allowed & (allowed >> spacing)
+            position = 0
+            while pairs >> position:
+                if pairs & (1 << position):
+                    for c in self._add_cover(distance, dots, mirrored,
+                                             measured, free, forbidden,
+                                             (position,
+                                              position + spacing)):
+                        yield c
+                position += 1
+        # }}}
+
+
+    def _add_cover(self, distance, dots, mirrored, measured, free,
+                   forbidden, positions):
+        # {{{
+        # Place new dots at positions, updating the measured index
+        # with just the distances from each new dot, then recurse.
+        for position in positions:
+            # dots >> position lines up dots above the new one with
+            # their distances from it, and mirrored does the same for
+            # dots below it.
+            measured |= ((dots >> position)
+                         | (mirrored >> (distance - position)))
+            dots |= 1 << position
+            mirrored |= 1 << (distance - position)
+        measured &= ~1
+        for c in self._cover(distance, dots, mirrored, measured,
+                             free - len(positions), forbidden):
+            yield c
+        # }}}
+
+    # }}} end of vim class fold
+
+
+_base.register_implementation(HolesExactCover)
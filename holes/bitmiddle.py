@@ -0,0 +1,174 @@
+# {{{ vim fold marker for module-level doctext
+"""
+This module finds the minimum number of dots/ticks on a straightedge,
+or HOLES in a template, such that you can still mark out any integer
+length up the total length using pairs of the tick marks/dots/holes.
+
+This implementation of the holes base class meets in the MIDDLE.
+Instead of generating whole bitwise combos, it generates left halves
+and right halves separately, then joins only those pairs of halves
+that could possibly work together.
+
+The largest distances can only be measured from a dot near one end
+to a dot near the other end.  So the dots in the outermost few
+positions of each half decide which of those largest distances a
+pair of halves leaves unmeasured, and halves get indexed by those
+outer dots to find compatible pairs without trying every pair.
+"""
+# }}}
+
+
+import logging  # {{{
+from . import _base
+from . import _util
+from . import bitbased
+from . import gospers
+
+__version__ = _util.__version__
+__all__ = []
+
+logger = _util.logger
+# }}}
+
+
+class HolesMeetInMiddle(bitbased.HolesBitwise):
+    # {{{
+    # {{{
+    """
+    Holes class implemented by joining separately generated halves.
+    It is descended from HolesBitwise, so combos are bitwise integers
+    internally, and best_combos() returns the same combos in the same
+    order as HolesBitwise.
+    """
+    # A left half has dot 0 and any dots up through the middle,
+    # distance // 2.  A right half has the dot at distance and any
+    # dots after the middle.  Each half's "outer pattern" is its dots
+    # in the outer_width positions at its end, as bits counting in
+    # from that end.  Dots l (from the left end) and r (from the
+    # right end) measure distance - (l + r), so the pair of outer
+    # patterns alone decides if the largest outer_width distances
+    # get measured.
+    # }}}
+
+
+    implementation_key = 'middle'
+    implementation_name = 'meet-in-the-middle bitwise implementation'
+
+    def __init__(self):
+        super().__init__()
+        # How many of the largest distances to index halves by.
+        self.outer_width = 8
+        self._halves_distance = None
+
+
+    def good_bit_combos(self, distance, dotcount):
+        # {{{
+        """
+        Bitwise combos with dotcount dots, including both endpoints,
+        that measure distance, built by joining compatible halves.
+        Returned in increasing integer order, like the other
+        bitwise implementations produce them.
+        """
+        if distance < 3 or self.canonical:
+            # Too short to split, or asked for canonical combos,
+            # which HolesBitwise already knows how to do.
+            return super().good_bit_combos(distance, dotcount)
+
+        combos = self.bit_combos_joined(distance, dotcount)
+        label = 'bit_combos_joined({}, {})'.format(distance, dotcount)
+        combos = self.log_progress(combos, label, 1000)
+        return self.in_order(combos)
+        # }}}
+
+
+    def bit_combos_joined(self, distance, dotcount):
+        # {{{
+        """
+        Join left and right halves with dotcount dots between them
+        into combos that measure distance, in no particular order.
+        """
+        self._index_halves(distance)
+        needed = (1 << (distance + 1)) - 2
+        compatible = self._compatible
+
+        for left_dots in range(1, dotcount):
+            right_dots = dotcount - left_dots
+            # Pairs of dots across the middle measure the rest.
+            cross_pairs = left_dots * right_dots
+            for (dots, pattern), lefts in self._lefts.items():
+                if dots != left_dots:
+                    continue
+                for right_pattern in compatible[pattern]:
+                    rights = self._rights.get((right_dots, right_pattern))
+                    if not rights:
+                        continue
+                    for left, left_measured in lefts:
+                        for right, right_measured in rights:
+                            missing = needed & ~(left_measured
+                                                 | right_measured)
+                            if _util.bit_count(missing) > cross_pairs:
+                                continue
+                            bit_combo = left | right
+                            if self.bit_combo_measures(bit_combo, distance):
+                                yield bit_combo
+        # }}}
+
+
+    def _index_halves(self, distance):
+        # {{{
+        # Generate and index every half for distance, once, then
+        # reuse them for every dotcount searched for that distance.
+        if self._halves_distance == distance:
+            return
+
+        middle = distance // 2
+        width = min(self.outer_width, middle + 1, distance - middle)
+        outer_mask = (1 << width) - 1
+
+        # Left halves: dot 0, plus dots 1 through middle.
+        lefts = dict()
+        for inner_dots in range(0, middle + 1):
+            for inner in gospers.bit_combos_gospers(middle, inner_dots):
+                half = (inner << 1) | 1
+                pattern = half & outer_mask
+                key = (inner_dots + 1, pattern)
+                lefts.setdefault(key, []).append(
+                    (half, self._bit_half_measures(half, distance)))
+
+        # Right halves: dot distance, plus dots middle+1 thru distance-1.
+        rights = dict()
+        inner_length = distance - middle - 1
+        for inner_dots in range(0, inner_length + 1):
+            for inner in gospers.bit_combos_gospers(inner_length,
+                                                    inner_dots):
+                half = (inner << (middle + 1)) | (1 << distance)
+                pattern = _util.mirror_bits(half >> (distance - width + 1),
+                                            width - 1)
+                key = (inner_dots + 1, pattern)
+                rights.setdefault(key, []).append(
+                    (half, self._bit_half_measures(half, distance)))
+
+        self._lefts = lefts
+        self._rights = rights
+        self._compatible = self.compatible_outer_patterns(width)
+        self._halves_distance = distance
+        logger.debug('{:>30}  {} left, {} right groups'.format(
+                     'halves for {}'.format(distance),
+                     len(lefts),
+                     len(rights)))
+        # }}}
+
+
+    def _bit_half_measures(self, half, distance):
+        # Bitmask of distances measured within one half by itself.
+        measured = 0
+        for spacing in range(1, distance + 1):
+            if half & (half >> spacing):
+                measured |= 1 << spacing
+        return measured
+
+
+    # }}} end of vim class fold
+
+
+_base.register_implementation(HolesMeetInMiddle)
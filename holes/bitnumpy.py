@@ -11,16 +11,27 @@ boost the speed of doing bitwise operations.
 
 
 import logging  # {{{
+import os
+import time
+import functools
+import itertools
 import numpy as np
 from . import _base
 from . import _util
 from . import bitbased
+from . import bounds
 from . import gospers
 
 __version__ = _util.__version__
 __all__ = []
 
 logger = _util.logger
+
+# Combos for distances up to this fit in one np.int_ (or uint64)
+# number.  Longer ones are stored as rows of WORD_BITS-bit words,
+# lowest word first, see words_np().
+WORD_DISTANCE = 62
+WORD_BITS = 64
 # }}}
 
 
@@ -39,6 +50,98 @@ class HolesBitwiseNumpy(bitbased.HolesBitwise):
 
     def __init__(self):
         super().__init__()
+        # How many combos candidate_blocks_np() makes at a time.
+        self.blocksize = 2**16
+        # How many spacings to test before the first compaction of
+        # the combos still in the running, doubling after each.
+        self.spacing_blocksize = 8
+        self._measure_key = None
+        # Optionally time these blocksizes for each distance and use
+        # the fastest, remembering them in calibration_file if given.
+        self.autotune = False
+        self.calibration_file = None
+        self.tuning_blocksizes = (2**12, 2**14, 2**16, 2**18)
+        self.tuned = dict()  # {distance: (blocksize, combos per sec)}
+
+
+    def good_bit_combos(self, distance, dotcount):
+        # {{{
+        """
+        Numpy version of bitbased.py's good_bit_combos().  Candidates
+        come from candidate_blocks_np() as numpy arrays, straight into
+        the numpy measure test, and only the good combos are turned
+        back into Python ints.  Resumes from a checkpoint's position,
+        a family index and rank in it, if there is one.
+        """
+        position, saved, count = self.checkpoint_resume(distance,
+                                                        dotcount)
+        combos = self._good_bit_combos_np(distance, dotcount, position)
+        if self.canonical:
+            combos = (c for c in combos
+                      if self.bit_combo_is_canonical(c, distance))
+        combos = self.checkpointed(combos, distance, dotcount)
+        return self.in_order(itertools.chain(saved, combos))
+        # }}}
+
+
+    def _good_bit_combos_np(self, distance, dotcount, start=None):
+        for block in self.candidate_blocks_np(distance, dotcount, start):
+            combos, combos_measure = self.bit_combos_measure_mask_np(
+                block, distance)
+            # Replace yield from for Python 3.2 compatibility.
+            for bitcombo in ints_np(combos[combos_measure]):
+                yield bitcombo
+
+
+    def candidate_blocks_np(self, distance, dotcount, start=None):
+        # {{{
+        """
+        Numpy version of candidate_bit_combos(), yielding uint64
+        arrays of up to self.blocksize combos from each of the
+        covering_families(), made by combo_blocks_np().  Past
+        WORD_DISTANCE, each combo is a row of words instead.
+        Starts at position start, [family index, rank], if given,
+        reporting the position after each block to the checkpoint
+        when asked for the next one.
+        """
+        width, families = self.covering_families(
+            distance, canonical=self.canonical)
+        inner_length = distance + 1 - 2 * width
+        label = 'candidate_blocks_np({}, {})'.format(distance, dotcount)
+        if distance > WORD_DISTANCE:
+            words = distance // WORD_BITS + 1
+        else:
+            words = None
+        progress = functools.partial(self.checkpoint_progress, distance,
+                                     dotcount)
+        blocks = self._candidate_blocks_np(families, width, inner_length,
+                                           dotcount, words,
+                                           self.blocksize_for(distance),
+                                           start or (0, 0), progress)
+        return self.log_progress(blocks, label, 1000)
+        # }}}
+
+
+    def _candidate_blocks_np(self, families, width, inner_length,
+                             dotcount, words, blocksize, start, progress):
+        first_index, first_rank = start
+        for index, given_bits in enumerate(families):
+            inner_dotcount = dotcount - _util.bit_count(given_bits)
+            if index < first_index or not (
+                    0 <= inner_dotcount <= inner_length):
+                continue
+            if words:
+                given = words_np((given_bits,), words)[0]
+            else:
+                given = np.uint64(given_bits)
+            rank = first_rank if index == first_index else 0
+            # Inner dots start just past the outer width positions.
+            for block in combo_blocks_np(inner_length, inner_dotcount,
+                                         blocksize, width, words, rank):
+                block |= given
+                yield block
+                rank += len(block)
+                progress([index, rank])
 
 
     def bit_combos_that_measure(self, bitcombos, distance):
@@ -51,7 +154,7 @@ class HolesBitwiseNumpy(bitbased.HolesBitwise):
         """
         # ToDo: Change chunkinate to make ndarrarys, not tuples?
         # ToDo: Clean this whole mess up?
-        chunksize=2**16
+        chunksize = self.blocksize_for(distance)
         chunks = _util.chunkinate(bitcombos, chunksize=chunksize)
         # label = 'np chunks of {}'.format(chunksize)
         # chunks = self.log_progress(chunks, label, step=2**8)
@@ -63,41 +166,275 @@ class HolesBitwiseNumpy(bitbased.HolesBitwise):
         # }}}
 
 
+    def count_good_bit_combos(self, distance, dotcount):
+        # {{{
+        """
+        How many good_bit_combos() there are, counted a chunk at a
+        time with numpy, never keeping the good combos themselves.
+        Canonical mode needs each good combo to check its mirror
+        image, so it counts them one by one like HolesBitwise.
+        """
+        if self.canonical:
+            return super().count_good_bit_combos(distance, dotcount)
+
+        position, saved, count = self.checkpoint_resume(distance,
+                                                        dotcount)
+        for block in self.candidate_blocks_np(distance, dotcount,
+                                              position):
+            combos, combos_measure = self.bit_combos_measure_mask_np(
+                block, distance)
+            found = int(np.count_nonzero(combos_measure))
+            self.checkpoint_found(distance, dotcount, count=found)
+            count += found
+        return count
+        # }}}
+
+
+    def count_bit_combos_that_measure(self, bitcombos, distance):
+        # {{{
+        """
+        How many of the iterator bitcombos measure distance, summing
+        bit_combos_measure_mask_np() masks chunk by chunk.
+        """
+        count = 0
+        chunks = _util.chunkinate(bitcombos,
+                                  chunksize=self.blocksize_for(distance))
+        for chunk in chunks:
+            combos, combos_measure = self.bit_combos_measure_mask_np(
+                chunk, distance)
+            count += int(np.count_nonzero(combos_measure))
+        return count
+        # }}}
+
+
+    def blocksize_for(self, distance):
+        # {{{
+        """
+        How many combos to make or measure at a time for distance.
+        Just self.blocksize, unless autotuning, when it is the
+        fastest of tuning_blocksizes, from calibration_file if it
+        has one for distance, or else timed by tune_blocksize().
+        """
+        if not self.autotune:
+            return self.blocksize
+        if distance not in self.tuned:
+            tuned = self.read_calibration(distance)
+            if tuned is None:
+                tuned = self.tune_blocksize(distance)
+                self.write_calibration(distance, tuned)
+            self.tuned[distance] = tuned
+            FMT = 'Blocksize for length {} - {:,d} - {:,.0f} combos/sec'
+            logger.info(FMT.format(distance, * tuned))
+        return self.tuned[distance][0]
+        # }}}
+
+
+    def tune_blocksize(self, distance):
+        # {{{
+        """
+        Time measuring the same random combos for distance, a chunk
+        of each of tuning_blocksizes at a time, returning the fastest
+        blocksize and its rate in combos per second.
+        """
+        # Random combos with both ends, and about as many dots as the
+        # best combos for distance could have, a dot at a time, at
+        # random positions in between, so it takes no more memory
+        # than the combos themselves.
+        dotcount, reason = bounds.lower_bound(distance, self.known_best)
+        random = np.random.RandomState(distance)
+        count = max(self.tuning_blocksizes)
+        words = distance // WORD_BITS + 1
+        sample = np.zeros((count, words), dtype=np.uint64)
+        rows = np.arange(count)
+
+        def add_dots(positions):
+            word, bit = np.divmod(positions.astype(np.uint64),
+                                  np.uint64(WORD_BITS))
+            sample[rows, word.astype(np.intp)] |= np.uint64(1) << bit
+
+        add_dots(np.zeros(count))
+        add_dots(np.full(count, distance))
+        for dot in range(dotcount - 2):
+            add_dots(random.randint(1, distance, count))
+        if distance <= WORD_DISTANCE:
+            sample = sample[:, 0]
+
+        best = None
+        for blocksize in self.tuning_blocksizes:
+            start_time = time.time()
+            for start in range(0, count, blocksize):
+                self.bit_combos_measure_mask_np(
+                    sample[start:start + blocksize], distance)
+            rate = count / max(time.time() - start_time, 1e-9)
+            logger.debug('{:>30}  {:,.0f} combos/sec'.format(
+                         'blocksize {:,d}'.format(blocksize), rate))
+            if best is None or rate > best[1]:
+                best = (blocksize, rate)
+        return best
+        # }}}
+
+
+    def read_calibration(self, distance):
+        # {{{
+        """
+        The (blocksize, rate) last written to calibration_file for
+        distance, or None if there is none.  Each line of the file
+        is distance, blocksize, rate, separated by commas.
+        """
+        if not self.calibration_file:
+            return None
+        if not os.path.exists(self.calibration_file):
+            return None
+        tuned = None
+        with open(self.calibration_file) as calibration:
+            for line in calibration:
+                fields = line.split(',')
+                if len(fields) == 3 and fields[0].strip() == str(distance):
+                    tuned = (int(fields[1]), float(fields[2]))
+        return tuned
+        # }}}
+
+
+    def write_calibration(self, distance, tuned):
+        # {{{
+        """
+        Append distance's tuned (blocksize, rate) to calibration_file,
+        if there is one.
+        """
+        if not self.calibration_file:
+            return
+        with open(self.calibration_file, 'a') as calibration:
+            calibration.write('{}, {}, {:.0f}\n'.format(distance, * tuned))
+        # }}}
+
+
+    def run_summary_extras(self, distance):
+        # {{{
+        """
+        When autotuning, add the blocksize used for distance, and the
+        rate it was measured at, to the performance summary.
+        """
+        extras = super().run_summary_extras(distance)
+        if distance in self.tuned:
+            blocksize, rate = self.tuned[distance]
+            extras['blocksize'] = blocksize
+            extras['combos_per_sec'] = int(rate)
+        return extras
+        # }}}
+
+
     def bit_combos_measure_np(self, chunk, distance):
         # {{{
         """
         Test a sequence of bitwide combinations using numpy,
         Only return those with pairs separated by 1 through distance.
         """
-        # Note: if line below fails, try wrapping chunk in tuple()
-        combos = np.array(chunk, dtype=np.int_)
-        spacings = np.array(range(1, distance + 1), dtype=np.int_)
-
-        # Reshape array, adding dummy dimensions that the arrays are
-        # only 1 long in, so that when we calculate the matrix of what
-        # spacings are measured by what combos, numpy's broadcasting
-        # rules will pretend the values have been copied along the
-        # necessary axes to give us a 2-D table of all possible
-        # combinations of combos and spacings.   For details,
-        # Read up on numpy's "broadcasting".
-        combos.shape = (len(combos), 1)
-        spacings.shape = (1, len(spacings))
-        #self.print_numpy_array_in_binary(combos)
-
-        # Calculate a matrix showing, for each combo,
-        # what distances does it have pairs that measure.
-        combos_measure_matrix = (combos & (combos >> spacings)) != 0
-        #self.print_numpy_array_in_binary(combos_measure_matrix)
-
-        combos_measure = combos_measure_matrix.all(axis=1)
-        #self.print_numpy_array_in_binary(combos_measure_sums)
-
-        combos.shape = (len(combos))
-
+        combos, combos_measure = self.bit_combos_measure_mask_np(
+            chunk, distance)
         combos_which_measure = combos[combos_measure]
         #self.print_numpy_array_in_binary(combos_which_measure)
 
-        return tuple(combos_which_measure)
+        return tuple(ints_np(combos_which_measure))
+        # }}}
+
+
+    def bit_combos_measure_mask_np(self, chunk, distance):
+        # {{{
+        """
+        Test a sequence of bitwide combinations using numpy.
+        Returns the combos as a numpy array, and a boolean array
+        of which ones have pairs separated by 1 through distance.
+        Past WORD_DISTANCE, the combos come back as rows of words,
+        see bit_combos_measure_mask_words_np().
+        """
+        if distance > WORD_DISTANCE:
+            combos = words_np(chunk, distance // WORD_BITS + 1)
+            return self.bit_combos_measure_mask_words_np(combos,
+                                                         distance)
+
+        # Note: if line below fails, try wrapping chunk in tuple()
+        if isinstance(chunk, np.ndarray):
+            combos = chunk
+        else:
+            combos = np.array(chunk, dtype=np.int_)
+        spacing_blocks, scratch = self._measure_buffers_np(
+            distance, combos.dtype, len(combos))
+
+        # Most combos fail on a few of the largest spacings, so test
+        # a block of spacings at a time, largest first, and only keep
+        # testing the combos that measured every spacing so far.
+        # Reshaping survivors to a column and each block of spacings
+        # to a row, numpy's broadcasting rules give a 2-D table of
+        # every survivor against every spacing in the block.  For
+        # details, read up on numpy's "broadcasting".
+        survivors = combos.reshape(len(combos), 1)
+        indices = np.arange(len(combos))
+        for spacings in spacing_blocks:
+            if not len(indices):
+                break
+            table = scratch[:len(indices), :spacings.shape[1]]
+            np.right_shift(survivors, spacings, out=table)
+            table &= survivors
+            measures = table.all(axis=1)
+            survivors = survivors[measures]
+            indices = indices[measures]
+
+        combos_measure = np.zeros(len(combos), dtype=bool)
+        combos_measure[indices] = True
+        return combos, combos_measure
+        # }}}
+
+
+    def _measure_buffers_np(self, distance, dtype, count):
+        # {{{
+        # The blocks of spacings, largest first, and a scratch table
+        # for bit_combos_measure_mask_np(), made once per distance
+        # and spacing_blocksize, and reused by every chunk, unless a
+        # chunk outgrows them.
+        key = (distance, dtype, self.spacing_blocksize)
+        if (self._measure_key != key
+                or len(self._measure_scratch) < count):
+            spacings = np.arange(distance, 0, -1, dtype=dtype)
+            # Blocks double in size, since survivors get fewer.
+            blocks = []
+            start, step = 0, self.spacing_blocksize
+            while start < distance:
+                blocks.append(spacings[start:start + step].reshape(1, -1))
+                start, step = start + step, step * 2
+            self._measure_spacings = blocks
+            self._measure_scratch = np.empty(
+                (max(count, self.blocksize),
+                 max([0] + [block.shape[1] for block in blocks])),
+                dtype=dtype)
+            self._measure_key = key
+        return self._measure_spacings, self._measure_scratch
+        # }}}
+
+
+    def bit_combos_measure_mask_words_np(self, combos, distance):
+        # {{{
+        """
+        Multi-word version of bit_combos_measure_mask_np(), for
+        combos stored as rows of words, lowest word first.  Shifting
+        a combo right by a spacing moves whole words over, then
+        shifts bits within words, carrying the low bits of each word
+        into the word below it.
+        """
+        count, words = combos.shape
+        combos_measure = np.ones(count, dtype=bool)
+        shifted = np.empty_like(combos)
+        for spacing in range(1, distance + 1):
+            word_shift, bit_shift = divmod(spacing, WORD_BITS)
+            kept = words - word_shift
+            shifted[:, kept:] = 0
+            if bit_shift:
+                shifted[:, :kept] = combos[:, word_shift:] >> bit_shift
+                shifted[:, :kept - 1] |= (combos[:, word_shift + 1:]
+                                          << (WORD_BITS - bit_shift))
+            else:
+                shifted[:, :kept] = combos[:, word_shift:]
+            combos_measure &= (combos & shifted).any(axis=1)
+        return combos, combos_measure
         # }}}
 
 
@@ -117,5 +454,115 @@ class HolesBitwiseNumpy(bitbased.HolesBitwise):
     # }}} end of vim class fold
 
 
+def combo_blocks_np(length, dots, blocksize, offset=0, words=None,
+                    first=0):
+    # {{{
+    """
+    Numpy version of gospers.bit_combos_gospers(), yielding the same
+    combos, in the same increasing order, as uint64 arrays of up to
+    blocksize at a time.  Each block is a run of consecutive ranks
+    unranked all at once by unrank_combos_np(), so no Python ints
+    are made along the way.  Combos get shifted left by offset bits,
+    and if words is given, are rows of that many words instead.
+    Starts at rank first, skipping the combos before it.
+    """
+    if dots < 0 or dots > length:
+        raise ValueError('dots must be 0 through length')
+    if words is None and length + offset > WORD_BITS:
+        raise ValueError('combos must fit in one word, or use words')
+
+    tables = colex_tables_np(length, dots)
+    total = _util.combinations_count(range(length), dots)
+    if total > 2**WORD_BITS:
+        raise ValueError('too many combos to rank with one word')
+    for start in range(first, total, blocksize):
+        stop = min(start + blocksize, total)
+        ranks = np.arange(start, stop, dtype=np.uint64)
+        yield unrank_combos_np(ranks, dots, tables, offset, words)
+    # }}}
+
+
+def colex_tables_np(length, dots):
+    # {{{
+    """
+    tables[i][c] is how many combos of i dots fit in the c
+    positions 0 through c - 1, that is, c choose i, for
+    unrank_combos_np().
+    """
+    tables = [None]
+    for i in range(1, dots + 1):
+        table = [_util.combinations_count(range(c), i)
+                 for c in range(length)]
+        tables.append(np.array(table, dtype=np.uint64))
+    return tables
+    # }}}
+
+
+def unrank_combos_np(ranks, dots, tables, offset=0, words=None):
+    # {{{
+    """
+    The combos with the given colex ranks, as a uint64 array, with
+    dots moved up by offset positions, or if words is given, as rows
+    of that many words.  In colex order, the rank of the combo with
+    dots at positions c1 < c2 < ... < ck is (c1 choose 1) + ... +
+    (ck choose k), so going from the top dot down, each dot is at
+    the highest position whose table entry still fits in the rank
+    left over.  That is one searchsorted() per dot for the whole
+    array.
+    """
+    ranks = ranks.copy()
+    if words:
+        combos = np.zeros((len(ranks), words), dtype=np.uint64)
+        rows = np.arange(len(ranks))
+    else:
+        combos = np.zeros(len(ranks), dtype=np.uint64)
+    one = np.uint64(1)
+    for i in range(dots, 0, -1):
+        positions = np.searchsorted(tables[i], ranks, side='right') - 1
+        ranks -= tables[i][positions]
+        positions = positions.astype(np.uint64) + np.uint64(offset)
+        if words:
+            word, bit = np.divmod(positions, np.uint64(WORD_BITS))
+            combos[rows, word.astype(np.intp)] |= one << bit
+        else:
+            combos |= one << positions
+    return combos
+    # }}}
+
+
+def words_np(combos, words):
+    # {{{
+    """
+    Combos as a 2-D uint64 array, one row of words per combo, lowest
+    word first.  Python int combos get split into words, and arrays
+    that are already rows of words are returned as is.
+    """
+    if isinstance(combos, np.ndarray) and combos.ndim == 2:
+        return combos
+    mask = (1 << WORD_BITS) - 1
+    rows = [[(int(combo) >> (WORD_BITS * word)) & mask
+             for word in range(words)] for combo in combos]
+    return np.array(rows, dtype=np.uint64).reshape(len(rows), words)
+    # }}}
+
+
+def ints_np(combos):
+    # {{{
+    """
+    Combos from a numpy array back as a list of Python ints, from
+    single numbers or from rows of words (see words_np()).
+    """
+    if combos.ndim == 1:
+        return combos.tolist()
+    ints = []
+    for row in combos.tolist():
+        combo = 0
+        for word, value in enumerate(row):
+            combo |= value << (WORD_BITS * word)
+        ints.append(combo)
+    return ints
+    # }}}
+
+
 _base.register_implementation(HolesBitwiseNumpy)
 
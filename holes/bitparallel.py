@@ -6,26 +6,74 @@ length up the total length using pairs of the tick marks/dots/holes.
 
 This implementation of the holes base class uses parallelization
 along with numpy to try to boost the speed of doing bitwise operations.
+Work goes to a pool of worker processes that lives as long as the
+holes instance, so each dotcount and length reuses the same workers.
+Workers send good combos back in batches as they find them, and the
+parent merges them back into order as they arrive.  Where Python has
+multiprocessing.shared_memory, the batches go through shared memory,
+along with counters of each worker's progress, and the queue just
+says when there are some to read.
+
+While the last tasks for one dotcount finish, workers that would
+otherwise sit idle make a start on the next dotcount, which is kept
+if no combos turn up, or else cancelled.
+
+With a checkpoint, finished tasks get recorded as a position, by
+their shard specs, and a resumed search skips them.
+
+Searches can be cancelled, by find-one mode finding its combo, by
+stopping early, or by cancel().  A shared flag tells the workers,
+which check it between chunks, so they are soon free for the next
+search.  Workers leave Ctrl-C to the parent, and exit on their own
+if the parent dies.
 """
 # }}}
 
 
 import logging  # {{{
+import os
+import time
+import signal
+import threading
 import functools
 import itertools
-from multiprocessing import Process, SimpleQueue
+import collections
+import heapq
+from multiprocessing import Pool, SimpleQueue, Value
 import numpy as np
 from . import _base
 from . import _util
 from . import bitnumpy
+from . import shards
+
+# Make shared memory optional, it is new in Python 3.8.
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
 
 __version__ = _util.__version__
 __all__ = []
 
 logger = _util.logger
+
+# Each pool worker process has its own holes instance to run tasks,
+# made by _init_worker() when the worker starts, the queue it sends
+# results back on, its slot in SharedResults, the SharedResults
+# of the search it last worked on, and the cancel flag, the id of
+# the last search cancelled.
+_worker_holes = None
+_worker_results = None
+_worker_slot = None
+_worker_shared = None
+_worker_cancel = None
 # }}}
 
 
+class SearchCancelled(Exception):
+    """A parallel search was cancelled before it finished."""
+
+
 class HolesBitwiseParallel(bitnumpy.HolesBitwiseNumpy):
 
     implementation_key = 'bitparallel'
@@ -35,115 +83,866 @@ class HolesBitwiseParallel(bitnumpy.HolesBitwiseNumpy):
         super().__init__()
         # Two threads or processes by default.
         self.parallels = 2
+        # Split each search into about this many tasks per worker,
+        # so workers that finish early can take on more.
+        self.tasks_per_worker = 8
+        # Workers send back good combos this many at a time.
+        self.result_batchsize = 256
+        # Room for this many good combos per worker in shared memory.
+        self.shared_capacity = 4096
+        # Seconds between progress log lines while searching.
+        self.progress_interval = 10
+        self._pool = None
+        self._pool_size = None
+        self._results = None
+        self._cancel = None
+        self._search_id = 0
+        # ParallelSearches by id, with tasks out on the pool, and
+        # the one for the next dotcount, if any, see speculate().
+        self._searches = dict()
+        self._speculative = None
+        # Start on the next dotcount while the last tasks finish.
+        self.speculative = True
+        # Called with the size of each chunk measured, see
+        # bit_combos_measure_mask_np().
+        self.tally = None
+        # Called between chunks, stopping the search if it returns
+        # True, by raising SearchCancelled.
+        self.cancelled = None
 
 
-    def best_bit_combos(self, distance):
+    def close(self):
         # {{{
         """
-        Copied from bitbased.py, but modified to account for the
-        fact that in a parallelized implementation, things are
-        returned a bit differently since filtering for good combos
-        happens in the children before the parent consolidates
-        the results.
+        Shut down the worker pool, if one was started.  A later
+        search starts a new one.  Searches still under way, like
+        the speculative one, get cancelled.
         """
-        found_one = False
+        self.discard_speculative()
+        for search in list(self._searches.values()):
+            self.cancel_tasks(search)
+            if search.shared is not None:
+                search.shared.close()
+        self._searches.clear()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        # }}}
+
 
-        # distance+1 positions, inclusive on both ends, +1 for range()
-        for dotcount in range(2, distance + 2):
-            #combos = self.bit_combos_with_ends(distance, dotcount)
-            combos = self.parallelize_good_combos(distance, dotcount)
+    def cancel(self, search=None):
+        # {{{
+        """
+        Cancel the search with id search, by default the newest one,
+        along with any before it.  The workers stop at their next
+        chunk, and skip the cancelled searches' tasks still to come.
+        Searches started after it carry on.  Safe to call from
+        another thread, like a timer's.
+        """
+        if search is None:
+            search = self._search_id
+        if self._cancel is not None:
+            self._cancel.value = max(self._cancel.value, search)
+        # }}}
+
+
+    def cancel_tasks(self, search):
+        # {{{
+        """
+        Cancel the ParallelSearch, and wait for its pending
+        AsyncResults, which is not long, since the tasks check
+        between chunks.  Then nothing is still using the search's
+        SharedResults.
+        """
+        self.cancel(search.id)
+        for result in search.pending:
+            result.wait()
+        # }}}
+
+
+    def search_cancelled(self, search):
+        # True if search, by its id, has been cancelled.
+        return self._cancel is not None and self._cancel.value >= search
+
+
+    def worker_pool(self):
+        # {{{
+        """
+        The pool of self.parallels worker processes, started the
+        first time it is needed, or again if parallels has changed.
+        """
+        if self._pool is not None and self._pool_size != self.parallels:
+            self.close()
+        if self._pool is None:
+            # Workers have to share this process's resource tracker,
+            # or theirs would unlink SharedResults when they exit.
+            if shared_memory is not None:
+                resource_tracker.ensure_running()
+            self._results = SimpleQueue()
+            slots = Value('i', 0)
+            self._cancel = Value('i', 0, lock=False)
+            self._pool = Pool(self.parallels, _init_worker,
+                              (self.implementation_key, self._results,
+                               slots, self._cancel, os.getpid()))
+            self._pool_size = self.parallels
+        return self._pool
+        # }}}
+
+
+    def worker_settings(self, distance):
+        # {{{
+        """
+        The attributes a worker's holes instance needs to match this
+        one for a task, sent along with every task since they can
+        change after the pool starts.
+        """
+        return {
+            'mode': self.mode,
+            'canonical': self.canonical,
+            'prune_prefixes': self.prune_prefixes,
+            'spacing_blocksize': self.spacing_blocksize,
+            'result_batchsize': self.result_batchsize,
+            'blocksize': self.blocksize_for(distance),
+            'autotune': False,}
+        # }}}
 
-            # With the action taking place in children, and them
-            # filtering the results before this, this logging
-            # is now misplaced.
-            # TODO: Move this logging to the children, IF it is
-            # safe to log from multiple threads (or use locking?)
-            #label = 'bit_combos_with_ends({}, {})'.format(distance,
-            #                                              dotcount)
-            #combos = self.log_progress(combos, label, 100000000)
 
-            # Combos prefiltered, thank you very much.
-            #combos = self.bit_combos_that_measure(combos, distance)
-            for c in combos:
-                # Don't keep looking at longer dotcounts.
-                found_one = True
-                yield c
+    def good_bit_combos(self, distance, dotcount):
+        # {{{
+        """
+        Parallelized version of bitbased.py's good_bit_combos().
+        Filtering for good combos happens in the children before
+        the parent merges the results, so the progress logging here
+        is of good combos as they arrive from the children.
+        """
+        # With the action taking place in children, and them
+        # filtering the results before this, this logging
+        # is now misplaced.
+        # TODO: Move this logging to the children, IF it is
+        # safe to log from multiple threads (or use locking?)
+        #label = 'bit_combos_with_ends({}, {})'.format(distance,
+        #                                              dotcount)
+        #combos = self.log_progress(combos, label, 100000000)
 
-            # Test found_one in the outer for loop, not the inner, so
-            # we can collect all good combos with same best dotcount.
-            # We just don't want to keep looking at higher dotcounts.
-            if found_one:
-                break
+        # Combos prefiltered, thank you very much.
+        combos = self.parallelize_good_combos(distance, dotcount)
+        label = 'parallel_good_combos({}, {})'.format(distance, dotcount)
+        combos = self.log_progress(combos, label, 1000)
+        if self.canonical:
+            combos = (c for c in combos
+                      if self.bit_combo_is_canonical(c, distance))
+        return combos
         # }}}
 
 
+    def count_good_bit_combos(self, distance, dotcount):
+        """
+        Parallelized version of bitnumpy.py's count_good_bit_combos().
+        In count-only mode, parallelize_good_combos() children count
+        their good combos and send back only the counts.
+        """
+        return self.parallelize_good_combos(distance, dotcount)
+
+
     def parallelize_good_combos(self, distance, dotcount):
-        # Get given patterns of some bits to give to parallel processes.
-        def inner_givens(parallels, dotcount):
-            # Find max power of two that doesn't go over parallel degrees.
-            # AND doesn't result in too many given bits for the dotcount
-            # being requested.  Dotcount - 2 is used to account for the
-            # two end dots, which are always 1's, and not included in the
-            # INNER givens.  (Example: If dot count is 3, no point trying to
-            # parallelize it with inner given (1,1), since the start and
-            # end dots already take two of the bits.)
-            # TODO: Clarify or document and test the heck out of this.
-            power_of_two = 0
-            while (2**power_of_two <= parallels) and (power_of_two <= dotcount - 2):
-                power_of_two += 1
-            power_of_two -= 1
-            # TODO: Log if stepping down to a power of two.
-            return itertools.product((0,1), repeat=power_of_two)
-
-        # If single process, don't bother.
-        # TODO: Change to an error check for < 1 if general case works for 1.
-        if self.parallels <= 1:
-            pass
-            # Add degenerate case here perhaps
-            # just calling bit_combos_that_measure_with_givens
-            # with leading=(1,) and trailing=(1,)
-
-        # Concatenate a 1 onto beginning of each inner_given tuple.
-        leading_givens = ( (1,) + ig for ig in inner_givens(self.parallels, dotcount) )
-        trailing_given = (1,)
-
-        # Spawn worker processes.
-        process_list = []
-        for leading_given in leading_givens:
-            #result = self.bit_combos_that_measure_with_givens(distance,
-            #                                                  dotcount,
-            #                                                  leading=leading_given,
-            #                                                  trailing=(1,))
-            # print('E', tuple(_util.sequence_from_bits(i) for i in tuple(result)))
-
-            # Handy print statement, keep this one, even if commented.
-            # print('C', dotcount, leading_given)
-            queue = SimpleQueue()
-            process = Process(target = self.parallelize_child_good_combos,
-                              args = (queue, distance, dotcount),
-                              kwargs = {"lead": leading_given,
-                                        "trail": trailing_given})
-            process.start()
-            process_list.append((process, queue))
-
-        # Collect worker processes
-        results = []
-        for (process, queue) in process_list:
-            results.extend(queue.get())
-            process.join()
-
-        ###print('D', results)
-        ###print('E', tuple(_util.sequence_from_bits(i) for i in results))
-        # TODO: Consider yielding as a generator for consistency?
-        return results
-
-
-    def parallelize_child_good_combos(self, queue, distance, dotcount, lead=(), trail=()):
-        result = self.bit_combos_that_measure_with_givens(distance,
-                                                          dotcount,
-                                                          leading=lead,
-                                                          trailing=trail)
-        queue.put(tuple(result))
+        # {{{
+        """
+        Good combos with dotcount dots, in increasing order, or in
+        count-only mode, how many, searched for by the worker pool.
+        Meanwhile the next dotcount gets queued up, see speculate().
+        """
+        search = self.start_search(distance, dotcount)
+        self.speculate(distance, dotcount + 1)
+        search.speculative = self._speculative
+
+        # In find-one mode, take whichever answer comes first.
+        if self.mode == 'one':
+            return self.parallelize_first_good_combo(search)
+
+        # Counts are small enough to just come back at the end.
+        if self.mode == 'count':
+            return self.parallelize_count_good_combos(search)
+
+        return self.parallelize_merged_good_combos(search)
+        # }}}
+
+
+    def search_key(self, distance, dotcount):
+        # {{{
+        """
+        Everything about a search that decides what its tasks are.
+        Split the search into tasks of about the same size, each
+        with its own leading and trailing given bits.  Tasks carry
+        the settings, tuned blocksize included, so all the workers
+        search the same way this instance would.
+        """
+        settings = self.worker_settings(distance)
+        givens = self.partition_givens(distance, dotcount)
+        return (distance, dotcount, tuple(sorted(settings.items())),
+                tuple(givens))
+        # }}}
+
+
+    def start_search(self, distance, dotcount):
+        # {{{
+        """
+        A ParallelSearch for good combos with dotcount dots, with its
+        tasks handed to the worker pool, or already under way if it
+        was the speculative search.  A speculative search for
+        anything else is no longer needed.
+        """
+        key = self.search_key(distance, dotcount)
+        if self._speculative is not None and self._speculative.key == key:
+            search = self._speculative
+            self._speculative = None
+            self.log_speculation(search, kept=True)
+            # Tasks it finished before it was kept count now.
+            self.checkpoint_tasks(search)
+            return search
+        self.discard_speculative()
+        return self.submit_search(key)
+        # }}}
+
+
+    def speculate(self, distance, dotcount):
+        # {{{
+        """
+        Queue up the search for good combos with dotcount dots,
+        behind the tasks already queued, so workers only get to it
+        when they would otherwise sit idle.  Most dotcounts have no
+        good combos, and then the next one is already under way.
+        If there were some, the speculative search gets discarded.
+        """
+        if not self.speculative:
+            return
+        if dotcount not in self.dotcount_range(distance):
+            return
+        self._speculative = self.submit_search(
+            self.search_key(distance, dotcount))
+        # }}}
+
+
+    def submit_search(self, key):
+        # {{{
+        """
+        Hand a new search's tasks to the worker pool, along with
+        where to find a new SharedResults for them, if shared memory
+        is available.  Returns the ParallelSearch.  Each task has an
+        id, (search, index), for its results.  Tasks a checkpoint
+        has as finished are skipped.
+        """
+        self._search_id += 1
+        search = ParallelSearch(self._search_id, key)
+        self.resume_tasks(search)
+        pool = self.worker_pool()
+        if search.tasks:
+            search.shared = self.shared_results(search.distance)
+        layout = search.shared.layout() if search.shared else None
+        search.pending = [
+            pool.apply_async(_worker_good_combos,
+                             (settings, (search.id, index), layout,
+                              search.distance, search.dotcount,
+                              leading, trailing))
+            for index, (settings, leading, trailing)
+            in enumerate(search.tasks) if not search.done[index]]
+        self._searches[search.id] = search
+        return search
+        # }}}
+
+
+    def resume_tasks(self, search):
+        # {{{
+        """
+        Mark the search's tasks the checkpoint has as finished as
+        done already, with the good combos found by them in the
+        first one's buffer, and their count in search.count.
+        """
+        position, saved, count = self.checkpoint_resume(search.distance,
+                                                        search.dotcount)
+        # Saved before any task finished, like the speculative
+        # search's when it is kept, is the same as none.
+        if not position:
+            return
+        finished = set(position)
+        if not finished <= set(search.specs):
+            raise ValueError('Checkpoint tasks {} are not from this '
+                             'search, check -p'.format(
+                             sorted(finished - set(search.specs))))
+        for index, spec in enumerate(search.specs):
+            if spec in finished:
+                search.done[index] = True
+                search.recorded.add(index)
+        # Any one finished task's stream will do, the combos just
+        # have to be in order.
+        if saved:
+            search.buffers[min(search.recorded)].extend(sorted(saved))
+        search.count = count
+        # }}}
+
+
+    def checkpoint_tasks(self, search):
+        # {{{
+        """
+        Report the search's tasks that finished since last time, and
+        the good combos they found, to the checkpoint, if it is on
+        the search's dotcount, with the position the finished tasks'
+        shard specs.  Tasks that were cancelled never finished.
+        The checkpoint keeps the combos from then on, so the search
+        lets go of its own list of them.
+        """
+        if self.checkpoint is None or not self.checkpoint.current(
+                search.distance, search.dotcount):
+            return
+        for index, finished in enumerate(search.finished):
+            if finished and index not in search.recorded:
+                self.checkpoint.found(search.distance, search.dotcount,
+                                      search.found[index],
+                                      search.counts[index])
+                search.found[index] = []
+                search.recorded.add(index)
+        self.checkpoint.progress(search.distance, search.dotcount,
+                                 sorted(search.specs[index]
+                                        for index in search.recorded))
+        # }}}
+
+
+    def finish_search(self, search, cancelled=False):
+        # {{{
+        """
+        Record the stats for a search, and release its shared
+        memory, after cancelling its tasks, if it did not finish.
+        Cancelling cancels its speculative search too.
+        """
+        if cancelled:
+            self.cancel_tasks(search)
+            self.discard_speculative(search)
+        self._searches.pop(search.id, None)
+        self.log_shared_results(search.shared, search.label,
+                                search.start_time)
+        # }}}
+
+
+    def discard_speculative(self, owner=None):
+        # {{{
+        """
+        Cancel the speculative search, if any, recording how much
+        work it did as wasted.  With owner, only if it is the one
+        queued up behind the ParallelSearch owner, not one a newer
+        search queued up since.
+        """
+        search = self._speculative
+        if search is None:
+            return
+        if owner is not None and search is not owner.speculative:
+            return
+        self._speculative = None
+        self.cancel_tasks(search)
+        self._searches.pop(search.id, None)
+        self.log_speculation(search, kept=False)
+        if search.shared is not None:
+            search.shared.close()
+        # }}}
+
+
+    def log_speculation(self, search, kept):
+        # {{{
+        """
+        Log and add up in stats how many combos a speculative search
+        checked, and in how many seconds of the workers' time, by
+        the time it got kept, or discarded as wasted.
+        """
+        checked, busy = 0, 0
+        if search.shared is not None:
+            checked, found, tasks, busy = search.shared.totals()
+        label = 'speculative_{}({})'.format('kept' if kept else 'wasted',
+                                            search.distance)
+        logger.debug('{:>30}  {} {:,d} checked in {:.6f} worker sec'
+                     .format(search.label, label, checked, busy / 1e6))
+        entry = self.stats.setdefault(label, {'count': 0, 'elapsed': 0})
+        entry['count'] += checked
+        entry['elapsed'] += busy / 1e6
+        entry['timestamp'] = time.time()
+        # }}}
+
+
+    def run_summary_extras(self, distance):
+        # {{{
+        """
+        Add how many combos speculative searches checked, kept and
+        wasted, to the performance summary.
+        """
+        extras = super().run_summary_extras(distance)
+        for name in ('speculative_kept', 'speculative_wasted'):
+            label = '{}({})'.format(name, distance)
+            if label in self.stats:
+                extras[name] = self.stats[label]['count']
+        return extras
+        # }}}
+
+
+    def shared_results(self, distance):
+        # {{{
+        """
+        A new SharedResults for one search, with a slot for each
+        worker, or None if this Python has no shared memory.
+        """
+        if shared_memory is None:
+            return None
+        words = 1
+        if distance > bitnumpy.WORD_DISTANCE:
+            words = distance // bitnumpy.WORD_BITS + 1
+        capacity = max(self.shared_capacity, self.result_batchsize)
+        return SharedResults(self.parallels, words, capacity)
+        # }}}
+
+
+    def receive_results(self):
+        # {{{
+        """
+        Wait for the next message from the workers, and sort any
+        good combos it brings into its search's buffers, by task
+        index, marking finished tasks done.  Returns the search the
+        message was about, or None if it was stale, from a search
+        that is over.
+        """
+        (search_id, index), kind, payload = self._results.get()
+        search = self._searches.get(search_id)
+        if search is None:
+            return None
+        # Checkpoints need the combos each task found, even after
+        # they get merged, until the task finishes, see
+        # checkpoint_tasks().
+        keep = self.checkpoint is not None
+        if kind == 'done':
+            # payload says if the task finished, or was cancelled.
+            search.done[index] = True
+            search.finished[index] = payload
+            if keep and payload:
+                self.checkpoint_tasks(search)
+        elif kind == 'combos':
+            search.buffers[index].extend(payload)
+            if keep:
+                search.found[index].extend(payload)
+        else:
+            # 'rows' means there are some in shared memory, which
+            # may as well all get read while we are at it.
+            shared = search.shared
+            for slot in range(shared.workers):
+                indexes, combos = shared.read(slot)
+                for task_index, combo in zip(indexes, combos):
+                    search.buffers[task_index].append(combo)
+                    if keep:
+                        search.found[task_index].append(combo)
+        return search
+        # }}}
+
+
+    def log_shared_results(self, shared, label, start_time, final=True):
+        # {{{
+        """
+        Log the workers' progress counters from shared memory, in
+        log_progress() style, and when final, record them in stats
+        under label and release the shared memory.
+        """
+        if shared is None:
+            return
+        elapsed = time.time() - start_time
+        checked, found, tasks, busy = shared.totals()
+        logger.debug('{:>30}  checked {:,d}, found {:,d}, {} tasks'
+                     ' in {:.6f} sec'.format(label, checked, found,
+                                             tasks, elapsed))
+        if not final:
+            return
+        for slot, rate in enumerate(shared.rates()):
+            logger.debug('{:>30}  {:,.0f} combos/sec'.format(
+                         'worker {}'.format(slot), rate))
+        self.stats[label] = {
+                 'count': checked,
+                 'elapsed': elapsed,
+                 'timestamp': time.time() }
+        shared.close()
+        # }}}
+
+
+    def parallelize_merged_good_combos(self, search):
+        # {{{
+        """
+        Good combos from all the search's tasks, yielded as they
+        arrive.  Each task's combos come in increasing order, so
+        merging them puts every combo in increasing order, the same
+        every time, whatever order the tasks finish in.
+        """
+        last_logged = time.time()
+
+        def task_combos(index):
+            nonlocal last_logged
+            buffer = search.buffers[index]
+            while True:
+                while buffer:
+                    yield buffer.popleft()
+                if search.done[index]:
+                    return
+                self.receive_results()
+                if self.search_cancelled(search.id):
+                    raise SearchCancelled(search.label)
+                if time.time() - last_logged >= self.progress_interval:
+                    self.log_shared_results(search.shared, search.label,
+                                            search.start_time,
+                                            final=False)
+                    last_logged = time.time()
+
+        finished = False
+        found = False
+        try:
+            streams = [task_combos(index)
+                       for index in range(len(search.tasks))]
+            # Replace yield from for Python 3.2 compatibility.
+            for combo in heapq.merge(* streams):
+                found = True
+                yield combo
+            finished = True
+        finally:
+            # Stopped early, so cancel the tasks still running.
+            self.finish_search(search, cancelled=not finished)
+        # No need for more dots when there are good combos with these.
+        if found:
+            self.discard_speculative(search)
+        # Re-raise any exception from the workers.
+        for result in search.pending:
+            result.get()
+        # }}}
+
+
+    def parallelize_count_good_combos(self, search):
+        # {{{
+        """
+        Count-only version of parallelize_good_combos(), adding up
+        the counts from all the search's tasks.
+        """
+        finished = False
+        try:
+            count = search.count
+            indexes = [index for index, done in enumerate(search.done)
+                       if not done]
+            for index, result in zip(indexes, search.pending):
+                search.counts[index] = result.get()
+                count += search.counts[index]
+                # Cancelled tasks count 0, so only count on if not.
+                if self.search_cancelled(search.id):
+                    raise SearchCancelled(search.label)
+                search.done[index] = True
+                search.finished[index] = True
+                self.checkpoint_tasks(search)
+            finished = True
+        finally:
+            self.finish_search(search, cancelled=not finished)
+        if count:
+            self.discard_speculative(search)
+        return count
+        # }}}
+
+
+    def givens_families(self, distance, dotcount):
+        # {{{
+        """
+        Families of givens every task's givens start with, and that
+        between them have every combo with dotcount dots.  Normally
+        just the endpoints, but canonical mode searches a couple of
+        families (see bitbased.py canonical_givens).
+        """
+        if self.canonical and distance >= 3:
+            families = self.canonical_givens(distance)
+        else:
+            families = (((1,), (1,)),)
+        return [(leading, trailing) for leading, trailing in families
+                if self.givens_fit(distance, dotcount, leading, trailing)]
+        # }}}
+
+
+    def partition_givens(self, distance, dotcount, tasks=None):
+        # {{{
+        """
+        Leading and trailing givens splitting the combos with
+        dotcount dots into tasks with roughly equal numbers of combos
+        each, at least tasks of them, by default tasks_per_worker
+        tasks per worker.  Any family of givens with too many combos
+        gets split in two, by the next leading bit being a 0 or a 1,
+        until none do.  Always split the same way, so results come
+        back in the same order.
+        """
+        def combos_count(leading, trailing):
+            inner_length = distance + 1 - len(leading) - len(trailing)
+            inner_dotcount = dotcount - sum(leading) - sum(trailing)
+            return _util.combinations_count(range(inner_length),
+                                            inner_dotcount)
+
+        families = self.givens_families(distance, dotcount)
+        total = sum(combos_count(* family) for family in families)
+        if tasks is None:
+            tasks = self.parallels * self.tasks_per_worker
+        target = max(1, total // tasks)
+
+        def split(leading, trailing):
+            room = distance + 1 - len(leading) - len(trailing)
+            if room == 0 or combos_count(leading, trailing) <= target:
+                return [(leading, trailing)]
+            givens = []
+            for bit in (0, 1):
+                if self.givens_fit(distance, dotcount,
+                                   leading + (bit,), trailing):
+                    givens.extend(split(leading + (bit,), trailing))
+            return givens
+
+        givens = []
+        for leading, trailing in families:
+            givens.extend(split(leading, trailing))
+        return givens
+        # }}}
+
+
+    def parallelize_first_good_combo(self, search):
+        """
+        Find-one version of parallelize_good_combos(), returning a
+        list with the first good combo any worker finds, or an empty
+        list if none of them find one.  Finding one cancels the
+        search, so the workers still looking stop.
+        """
+        finished = False
+        try:
+            # Each task sends one combo or none, then says it is done.
+            # A speculative search may have sent them all already.
+            while True:
+                for buffer in search.buffers:
+                    if buffer:
+                        return [buffer[0]]
+                if all(search.done):
+                    break
+                self.receive_results()
+                if self.search_cancelled(search.id):
+                    raise SearchCancelled(search.label)
+            finished = True
+        finally:
+            # Found one, or something went wrong, so cancel the rest.
+            self.finish_search(search, cancelled=not finished)
+        for result in search.pending:
+            result.get()
+        return []
+
+
+    def child_good_combos(self, distance, dotcount, lead=(), trail=()):
+        """
+        Good combos, in increasing order, or in count-only mode just
+        how many there are, with dotcount dots and the given leading
+        and trailing bits.  This is one task's work in a worker.
+        """
+        combos = self.bit_combos_with_givens(distance, dotcount,
+                                             lead, trail,
+                                             self.prune_prefixes)
+
+        # Count-only mode sends back just an int, never the combos.
+        if self.mode == 'count':
+            if self.canonical:
+                combos = self.bit_combos_that_measure(combos, distance)
+                return self.count_with_mirrors(combos, distance)
+            return self.count_bit_combos_that_measure(combos, distance)
+
+        result = self.bit_combos_that_measure(combos, distance)
+        if self.mode == 'one':
+            return itertools.islice(result, 1)
+        return result
+
+
+    def bit_combos_measure_mask_np(self, chunk, distance):
+        # {{{
+        """
+        bitnumpy.py's bit_combos_measure_mask_np(), also calling
+        self.tally, if set, with how many combos each chunk has,
+        so workers can count what they check a chunk at a time,
+        and raising SearchCancelled if self.cancelled says to stop.
+        """
+        if self.cancelled is not None and self.cancelled():
+            raise SearchCancelled()
+        if self.tally is not None:
+            self.tally(len(chunk))
+        return super().bit_combos_measure_mask_np(chunk, distance)
+        # }}}
+
+
+    def shard_specs(self, distance, dotcount=None, count=None):
+        # {{{
+        """
+        Spec strings for about count shards of the search for good
+        combos with dotcount dots, by default the fewest dots the
+        bounds allow, split like partition_givens() splits tasks.
+        See the shards module.  Shards are in increasing order of
+        the combos in them.
+        """
+        if dotcount is None:
+            self.plan_dotcounts(distance)
+            dotcount = self.dotcount_range(distance)[0]
+        return [shards.format_spec(distance, dotcount, leading, trailing)
+                for leading, trailing in self.partition_givens(
+                    distance, dotcount, count)]
+        # }}}
+
+
+    def run_shard(self, spec, filename):
+        # {{{
+        """
+        Find the good combos in the shard with spec, using
+        bit_combos_that_measure_with_givens(), and write them to a
+        shard file, along with how long it took.  Returns how many
+        were found.
+        """
+        distance, dotcount, leading, trailing = shards.parse_spec(spec)
+        checked = [0]
+
+        def tally(count):
+            checked[0] += count
+
+        def footer():
+            return {'checked': checked[0],
+                    'elapsed': '{:.6f}'.format(time.time() - start_time)}
+
+        start_time = time.time()
+        self.tally = tally
+        try:
+            combos = self.bit_combos_that_measure_with_givens(
+                distance, dotcount, leading, trailing)
+            found = shards.write_shard(filename, spec, combos, footer)
+        finally:
+            self.tally = None
+        logger.info('Shard {} - found {} - took {:.3f} sec'.format(
+                    spec, found, time.time() - start_time))
+        return found
+        # }}}
+
+
+    def missing_shards(self, givens):
+        # {{{
+        """
+        Specs of the shards missing from givens, a list of (distance,
+        dotcount, leading, trailing) for the same distance and
+        dotcount, that it takes to cover the whole search, however
+        many tasks partition_givens() split it into.  Any family of
+        givens with no shard of its own needs shards for both its
+        next leading bits, like partition_givens() splits them.
+        """
+        if not givens:
+            return []
+        distance, dotcount = givens[0][:2]
+        found = set((leading, trailing)
+                    for d, k, leading, trailing in givens)
+        missing = []
+        families = list(reversed(self.givens_families(distance, dotcount)))
+        while families:
+            leading, trailing = families.pop()
+            if (leading, trailing) in found:
+                continue
+            split = any(t == trailing and len(l) > len(leading)
+                        and l[:len(leading)] == leading
+                        for l, t in found)
+            if not split:
+                missing.append(shards.format_spec(distance, dotcount,
+                                                  leading, trailing))
+                continue
+            for bit in (1, 0):
+                if self.givens_fit(distance, dotcount,
+                                   leading + (bit,), trailing):
+                    families.append((leading + (bit,), trailing))
+        return missing
+        # }}}
+
+
+    def merge_shards(self, filenames):
+        # {{{
+        """
+        Good bitwise combos from shard files, in increasing order.
+        The shards have to all be for the same distance and
+        dotcount.  partition_givens() splits by leading bits, so
+        every combo in a shard is less than every combo in shards
+        with greater leading bits.  Reading whole files in that
+        order merges them, with just one file open at a time,
+        however many there are.  Records the checked count and
+        time the shard jobs took in stats.
+        """
+        specs = dict()
+        for filename in filenames:
+            spec = shards.read_shard_spec(filename)
+            if spec in specs:
+                raise ValueError('Shard {} is in both {} and {}'.format(
+                                 spec, specs[spec], filename))
+            specs[spec] = filename
+        parsed = sorted((shards.parse_spec(spec), spec) for spec in specs)
+        if len(set(given[:2] for given, spec in parsed)) > 1:
+            raise ValueError('Shards are not all for the same distance '
+                             'and dotcount')
+        missing = self.missing_shards([given for given, spec in parsed])
+        if missing:
+            raise ValueError('Shards do not cover the whole search, '
+                             'missing {}'.format(', '.join(missing)))
+
+        checked, elapsed = 0, 0.0
+        for (distance, dotcount, leading, trailing), spec in parsed:
+            footer = dict()
+            # Replace yield from for Python 3.2 compatibility.
+            for combo in shards.read_shard(specs[spec], footer):
+                yield combo
+            checked += int(footer.get('checked', 0))
+            elapsed += footer.get('elapsed', 0.0)
+            label = 'shard_checked({}, {})'.format(distance, dotcount)
+            self.stats[label] = {
+                     'count': checked,
+                     'elapsed': elapsed,
+                     'timestamp': time.time() }
+        # }}}
+
+
+    def do_merge_run(self, filenames):
+        # {{{
+        """
+        Like do_run(), but merging shard files instead of searching,
+        see merge_shards().  Yields the combos as they are merged,
+        as sequences, then logs the performance summary.  If the
+        shards have no good combos, the best ones have more dots,
+        so the next step is shards for the next dotcount.
+        """
+        self.stats = dict()
+        logger.info('-' * 30)
+        logger.info('Merging {} shard files ...'.format(len(filenames)))
+
+        start_time = time.time()
+        distance, dotcount = 0, 0
+        if filenames:
+            distance, dotcount, leading, trailing = shards.parse_spec(
+                shards.read_shard_spec(filenames[0]))
+        bit_combos = self.log_progress(self.merge_shards(filenames),
+                                       'merge_shards', 100000)
+        count = 0
+        for count, bit_combo in enumerate(bit_combos, start=1):
+            yield _util.sequence_from_bits(bit_combo)
+        elapsed_time = time.time() - start_time
+
+        if count:
+            FMT = 'Best combos for length {} - found {} - took {:.3f} sec'
+            logger.info(FMT.format(distance, count, elapsed_time))
+        else:
+            FMT = 'No combos for length {} with {} dots - try more dots'
+            logger.info(FMT.format(distance, dotcount))
+        for line in self._stats_display_lines():
+            logger.debug(line)
+        run_summary = {
+            'action': 'merge_shards',
+            'distance': distance,
+            'time_elapsed': elapsed_time,
+            'result_n_dots': dotcount,
+            'result_count': count,
+            'shards': len(filenames),
+            'mode': self.mode,}
+        self.log_performance(run_summary)
+        self.run_summary = run_summary
+        # }}}
 
 
     # TODO: Consider if want to convert bit combos to sequence combos
@@ -165,88 +964,15 @@ class HolesBitwiseParallel(bitnumpy.HolesBitwiseNumpy):
         """
         # Start only with those combinations that have given end bits.
         combos = self.bit_combos_with_givens(distance, dotcount,
-                                             leading, trailing)
+                                             leading, trailing,
+                                             self.prune_prefixes)
         # Let bitnumpy chunk it up and determine which are good.
         combos = self.bit_combos_that_measure(combos, distance)
         for combo in combos:
             yield combo
 
 
-    def bit_combos_with_givens(
-            self, distance, dotcount, leading=(), trailing=()):
-        """
-        All bitwise combos with dotcount dots that include some
-        fixed given leading or trailing bits.  This can be useful
-        A) to reduce the number of combinations generated if you
-           already know both the first and last bit must be 1's, and
-        B) to fill in other known bits, perhaps to break apart the
-           overall generation across 2 cluster nodes by having
-           one node generate all combos starting with 0, and the
-           other node generate all combos starting with 1.
-        The geven leading and trailing bits are passed as
-        tuples of 0's and 1's.
-        """
-        # TODO: Move to _util ?
-        def tuple_to_bits(tuple):
-            bits = 0
-            for value in tuple:
-                bits <<= 1
-                if value == 1:
-                    bits |= 1
-                elif value == 0:
-                    pass
-                else:
-                    raise ValueError("Given tuple values must be 0's or 1's")
-            return bits
-
-        def bitmask_of_givens(distance, leading, trailing):
-            length = distance + 1
-            leading_bits = tuple_to_bits(leading)
-            leading_bits <<= (length - len(leading))
-            trailing_bits = tuple_to_bits(trailing)
-            given_bits = leading_bits | trailing_bits
-            return given_bits
-
-        def dotcount_of_givens(leading, trailing):
-            count = 0
-            for value in leading:
-                if value == 1:
-                    count += 1
-            for value in trailing:
-                if value == 1:
-                    count += 1
-            return count
-
-        inner_distance = distance - len(leading) - len(trailing)
-        inner_length = inner_distance + 1
-        inner_dotcount = dotcount - dotcount_of_givens(leading, trailing)
-        if inner_length < 0:
-            raise ValueError(("Distance {} must at least cover given " +
-                              "leading ({}) and trailing({}) bits").format(
-                               distance, leading, trailing))
-        if inner_dotcount < 0:
-            raise ValueError(("Dotcount {} must at least cover given " +
-                              "leading ({}) and trailing({}) bits").format(
-                               dotcount, leading, trailing))
-
-        given_bits = bitmask_of_givens(distance, leading, trailing)
-
-        # Avoid 0-length inner combo.
-        if inner_length == 0:
-            bit_combo = given_bits
-            yield bit_combo
-            return
-
-        inner_bit_combos = self.bit_combos_with_n_dots(inner_distance,
-                                                       inner_dotcount)
-        for bit_combo in inner_bit_combos:
-            # Move inner bits over and stick given bits back on each end.
-            bit_combo <<= len(trailing)
-            bit_combo |= given_bits
-            yield bit_combo
-
-
-    def bit_combos_with_ends(self, distance, dotcount):
+    def bit_combos_with_ends(self, distance, dotcount, prune=False):
         """
         For the moment, just override bitnumpy.py's implementation
         with an implementation using bit_combos_with_givens.
@@ -256,10 +982,283 @@ class HolesBitwiseParallel(bitnumpy.HolesBitwiseNumpy):
         for bit_combo in self.bit_combos_with_givens(distance,
                                                      dotcount,
                                                      leading,
-                                                     trailing):
+                                                     trailing,
+                                                     prune):
             # print(bin(bit_combo))
             yield bit_combo
 
 
+class ParallelSearch(object):
+    # {{{
+    """
+    One search's tasks out on the worker pool, and what has come
+    back from them so far.  key is from search_key().
+    """
+
+    def __init__(self, search_id, key):
+        self.id = search_id
+        self.key = key
+        self.distance, self.dotcount, settings, givens = key
+        settings = dict(settings)
+        self.tasks = [(settings, leading, trailing)
+                      for leading, trailing in givens]
+        self.specs = [shards.format_spec(self.distance, self.dotcount,
+                                         leading, trailing)
+                      for leading, trailing in givens]
+        self.label = 'parallel_checked({}, {})'.format(self.distance,
+                                                       self.dotcount)
+        self.start_time = time.time()
+        self.shared = None
+        self.pending = []
+        self.buffers = [collections.deque() for task in self.tasks]
+        self.done = [False] * len(self.tasks)
+        # Tasks that finished, and were not cancelled, what each one
+        # found, kept for checkpoints, and those already reported to
+        # the checkpoint, see checkpoint_tasks().  count is from
+        # tasks finished before resuming from a checkpoint.
+        self.finished = [False] * len(self.tasks)
+        self.found = [[] for task in self.tasks]
+        self.counts = [0] * len(self.tasks)
+        self.recorded = set()
+        self.count = 0
+        # The speculative search queued up behind this one, if any.
+        self.speculative = None
+    # }}}
+
+
+class SharedResults(object):
+    # {{{
+    """
+    Shared memory for one parallel search, with a slot for each
+    worker.  Each slot has progress counters, and a ring buffer the
+    worker appends good combos to, each tagged with its task index,
+    for the parent to read.  The parent makes it, and workers attach
+    to it by the name and sizes from layout().
+    """
+    # Counter columns.  The worker updates all but READ, which is how
+    # far the parent has read the ring buffer.
+    CHECKED, FOUND, TASKS, BUSY, WRITTEN, READ = range(6)
+    COUNTERS = 6
+
+    def __init__(self, workers, words, capacity, name=None):
+        self.workers = workers
+        self.words = words
+        self.capacity = capacity
+        counters_size = 8 * workers * self.COUNTERS
+        rings_size = 8 * workers * capacity * (1 + words)
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(
+                create=True, size=counters_size + rings_size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.counters = np.ndarray((workers, self.COUNTERS),
+                                   dtype=np.int64, buffer=self.memory.buf)
+        # Each row is the task index, then the combo's words.
+        self.rings = np.ndarray((workers, capacity, 1 + words),
+                                dtype=np.uint64, buffer=self.memory.buf,
+                                offset=counters_size)
+        if self.owner:
+            self.counters[:] = 0
+
+
+    def layout(self):
+        return (self.workers, self.words, self.capacity, self.name)
+
+
+    def tally(self, slot, column, count):
+        self.counters[slot, column] += count
+
+
+    def write(self, slot, index, combos, wait=0.001, cancelled=None):
+        # {{{
+        """
+        Append combos from task index to slot's ring buffer, waiting
+        for the parent to read enough of it first if it is full,
+        unless cancelled() says the parent has stopped reading.
+        Returns how many got written, at most capacity at a time.
+        """
+        combos = combos[:self.capacity]
+        count = len(combos)
+        counters = self.counters[slot]
+        while (counters[self.WRITTEN] - counters[self.READ]
+               + count > self.capacity):
+            if cancelled is not None and cancelled():
+                raise SearchCancelled()
+            time.sleep(wait)
+        written = int(counters[self.WRITTEN])
+        rows = np.arange(written, written + count) % self.capacity
+        self.rings[slot, rows, 0] = index
+        self.rings[slot, rows, 1:] = bitnumpy.words_np(combos, self.words)
+        # Only now can the parent see them.
+        counters[self.WRITTEN] = written + count
+        return count
+        # }}}
+
+
+    def read(self, slot):
+        # {{{
+        """
+        Task indexes and combos written to slot's ring buffer since
+        the last read(), as lists.
+        """
+        counters = self.counters[slot]
+        read = int(counters[self.READ])
+        written = int(counters[self.WRITTEN])
+        rows = self.rings[slot, np.arange(read, written) % self.capacity]
+        counters[self.READ] = written
+        indexes = rows[:, 0].tolist()
+        if self.words == 1:
+            combos = rows[:, 1].tolist()
+        else:
+            combos = bitnumpy.ints_np(rows[:, 1:])
+        return indexes, combos
+        # }}}
+
+
+    def totals(self):
+        # Combos checked, found, tasks done, and busy microseconds.
+        return self.counters[:, :self.WRITTEN].sum(axis=0).tolist()
+
+
+    def rates(self):
+        # Combos each worker checked per second spent on tasks.
+        checked = self.counters[:, self.CHECKED]
+        busy = np.maximum(self.counters[:, self.BUSY], 1) / 1e6
+        return (checked / busy).tolist()
+
+
+    def close(self):
+        # Views of the memory have to go before it can be closed.
+        self.counters = self.rings = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+    # }}}
+
+
+def _init_worker(implementation_key, results, slots, cancel, parent):
+    # {{{
+    # Pool initializer, run once in each worker process.
+    global _worker_holes, _worker_results, _worker_slot, _worker_cancel
+    # Ctrl-C goes to the whole process group, but it is up to the
+    # parent to cancel, and then close the pool.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    watchdog = threading.Thread(target=_watch_parent, args=(parent,))
+    watchdog.daemon = True
+    watchdog.start()
+    impl_class = _base.implementations[implementation_key]['_class']
+    _worker_holes = impl_class()
+    _worker_results = results
+    _worker_cancel = cancel
+    with slots.get_lock():
+        _worker_slot = slots.value
+        slots.value += 1
+    # }}}
+
+
+def _watch_parent(parent, interval=1.0):
+    # {{{
+    # Runs in a thread in each worker.  If the parent dies without
+    # shutting down the pool, the worker gets a new parent, so exit
+    # rather than keep working on tasks nobody will ever collect.
+    while os.getppid() == parent:
+        time.sleep(interval)
+    os._exit(1)
+    # }}}
+
+
+def _worker_cancelled(search):
+    # True if the parent cancelled search, by its id.
+    return _worker_cancel.value >= search
+
+
+def _worker_shared_results(layout):
+    # {{{
+    # This worker's view of a search's SharedResults, attaching to
+    # it on the search's first task, or None to use the queue alone.
+    global _worker_shared
+    if layout is None:
+        return None
+    workers, words, capacity, name = layout
+    if _worker_slot >= workers:
+        # A replacement for a worker that died, with no slot.
+        return None
+    if _worker_shared is None or _worker_shared.name != name:
+        if _worker_shared is not None:
+            _worker_shared.close()
+        _worker_shared = SharedResults(workers, words, capacity, name)
+    return _worker_shared
+    # }}}
+
+
+def _worker_good_combos(settings, task_id, layout, distance, dotcount,
+                        lead, trail):
+    # {{{
+    # Run one task in a worker process, see child_good_combos().
+    # Counts get returned, combos get sent in batches as they turn
+    # up, then 'done', even if something goes wrong, so the parent
+    # knows the task is done, saying if it finished, so it can go
+    # in a checkpoint.  Batches go into shared memory if
+    # there is any, with just a note on the queue to go read them.
+    # Tasks of a cancelled search stop between chunks, and count as
+    # done, with nothing found.
+    for name, value in settings.items():
+        setattr(_worker_holes, name, value)
+    start_time = time.time()
+    shared = _worker_shared_results(layout)
+    slot = _worker_slot
+    cancelled = functools.partial(_worker_cancelled, task_id[0])
+    _worker_holes.cancelled = cancelled
+    _worker_holes.tally = None
+    if shared is not None:
+        _worker_holes.tally = functools.partial(shared.tally, slot,
+                                                shared.CHECKED)
+
+    if _worker_holes.mode == 'count':
+        count = 0
+        try:
+            if not cancelled():
+                count = _worker_holes.child_good_combos(distance, dotcount,
+                                                        lead, trail)
+        except SearchCancelled:
+            pass
+        if shared is not None:
+            shared.tally(slot, shared.FOUND, count)
+            shared.tally(slot, shared.TASKS, 1)
+            shared.tally(slot, shared.BUSY,
+                         int((time.time() - start_time) * 1e6))
+        return count
+
+    finished = False
+    try:
+        combos = ()
+        if not cancelled():
+            combos = _worker_holes.child_good_combos(distance, dotcount,
+                                                     lead, trail)
+        for batch in _util.chunkinate(combos,
+                                      _worker_holes.result_batchsize):
+            if shared is None:
+                _worker_results.put((task_id, 'combos', batch))
+                continue
+            shared.tally(slot, shared.FOUND, len(batch))
+            while batch:
+                written = shared.write(slot, task_id[1], batch,
+                                       cancelled=cancelled)
+                _worker_results.put((task_id, 'rows', slot))
+                batch = batch[written:]
+        finished = not cancelled()
+    except SearchCancelled:
+        pass
+    finally:
+        if shared is not None:
+            shared.tally(slot, shared.TASKS, 1)
+            shared.tally(slot, shared.BUSY,
+                         int((time.time() - start_time) * 1e6))
+        _worker_results.put((task_id, 'done', finished))
+    # }}}
+
+
 _base.register_implementation(HolesBitwiseParallel)
 
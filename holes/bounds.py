@@ -0,0 +1,82 @@
+"""
+Proven bounds on the number of dots a best combo can have.
+
+Implementations search dotcounts from low to high, so anything known
+to be too few dots for a distance never needs to be enumerated.
+"""
+
+from . import _util
+
+__version__ = _util.__version__
+__all__ = []
+
+
+def pair_lower_bound(distance):
+    # {{{
+    """
+    The fewest dots that make enough pairs to measure distance.
+    A combo with k dots only has k(k-1)/2 pairs of dots, so it
+    cannot measure more than k(k-1)/2 different distances, and
+    measuring all of 1 through distance takes at least that many.
+    """
+    dotcount = 0
+    while dotcount * (dotcount - 1) // 2 < distance:
+        dotcount += 1
+    return dotcount
+    # }}}
+
+
+def known_lower_bound(distance, known_best):
+    # {{{
+    """
+    The most dots any shorter distance was found to need.
+    known_best maps distances already solved to their best dotcount.
+    Best dotcounts never go down as the distance goes up (see any
+    table of optimal sparse rulers), so whatever a shorter distance
+    needed, this distance needs at least as many.
+    Returns 0 if no shorter distance has been solved.
+    """
+    shorter = [known_best[d] for d in known_best if d < distance]
+    if not shorter:
+        return 0
+    return max(shorter)
+    # }}}
+
+
+def lower_bound(distance, known_best=None):
+    # {{{
+    """
+    The best proven lower bound on dots for distance, along with a
+    short explanation of where it came from, for logging.
+    Returns (dotcount, reason).
+    """
+    dotcount = pair_lower_bound(distance)
+    reason = '{} dots have only {} pair(s)'.format(
+        dotcount - 1,
+        (dotcount - 1) * (dotcount - 2) // 2)
+
+    if known_best:
+        known = known_lower_bound(distance, known_best)
+        if known > dotcount:
+            dotcount = known
+            reason = 'a shorter length already needed {} dots'.format(
+                known)
+
+    return dotcount, reason
+    # }}}
+
+
+def upper_bound(distance):
+    # {{{
+    """
+    The fewest dots used by a known construction for distance, which
+    always works, so the best dotcount can never be higher.  Returns
+    (dotcount, reason), like lower_bound().
+    """
+    # Imported here, not at the top, since constructions checks its
+    # combos with bitbased.py, which needs _base.py, which needs this.
+    from . import constructions
+    dotcount = constructions.construction_dotcount(distance)
+    reason = 'known construction has {} dots'.format(dotcount)
+    return dotcount, reason
+    # }}}
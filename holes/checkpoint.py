@@ -0,0 +1,217 @@
+"""
+Checkpoints of a long best combos run, so it can pick up where it
+left off after a reboot, or getting killed for running out of memory.
+
+A checkpoint file gets written now and then during a run, and removed
+when the run finishes.  It has the dotcount being searched, how far
+along that search is, its position, and the good bitwise combos found
+before that position.  What a position is depends on the
+implementation, like how many families of candidates are done, or
+which parallel tasks are, as long as JSON can hold it.  Everything
+before the position is done, and nothing after it is:
+
+    {"format": "holey checkpoint 1",
+     "args": ["-n", "30"],
+     "distance": 30, "mode": "all", "dotcount": 10,
+     "position": [112, 65536],
+     "bit_combos": [...], "count": 0}
+
+Searching dotcount means every dotcount before it has no good
+combos, so resuming the run starts at dotcount, from its position.
+"""
+
+import os
+import json
+import time
+from . import _util
+
+__version__ = _util.__version__
+__all__ = []
+
+logger = _util.logger
+
+CHECKPOINT_FORMAT = 'holey checkpoint 1'
+
+
+class Checkpoint(object):
+    # {{{
+    """
+    Where a best combos run for distance is up to, saved to filename
+    every interval seconds, at most, see save_when_due().  args are
+    whatever it takes to run it again, like command line arguments.
+    Implementations report progress for one dotcount at a time, with
+    begin(), found(), and progress(), ignoring any other searches,
+    like a speculative one or another length's.
+    """
+
+    def __init__(self, filename, interval=300.0, args=()):
+        self.filename = filename
+        self.interval = interval
+        self.args = list(args)
+        self.distance = None
+        self.mode = None
+        self.dotcount = None
+        self.position = None
+        self.bit_combos = []
+        self.count = 0
+        # Found, but not before any position yet.
+        self._pending_combos = []
+        self._pending_count = 0
+        self._saved_time = time.time()
+
+
+    @classmethod
+    def load(cls, filename, interval=300.0):
+        # {{{
+        """
+        The Checkpoint in filename, to resume its run, and keep
+        saving it to the same file.  Raises ValueError if it is not
+        a checkpoint file.  Positions come back with lists for any
+        tuples they had.
+        """
+        with open(filename) as checkpoint_file:
+            try:
+                values = json.load(checkpoint_file)
+            except ValueError:
+                values = None
+        if not isinstance(values, dict) or (
+                values.get('format') != CHECKPOINT_FORMAT):
+            raise ValueError('{} is not a checkpoint file'
+                             .format(filename))
+        checkpoint = cls(filename, interval, values['args'])
+        checkpoint.distance = values['distance']
+        checkpoint.mode = values['mode']
+        checkpoint.dotcount = values['dotcount']
+        checkpoint.position = values['position']
+        checkpoint.bit_combos = values['bit_combos']
+        checkpoint.count = values['count']
+        return checkpoint
+        # }}}
+
+
+    def start(self, distance, mode):
+        # {{{
+        """
+        Start, or resume, the run for distance in mode.  Returns the
+        dotcount to resume at, or None for a new run.  Raises
+        ValueError if the checkpoint is for some other run.
+        """
+        if self.distance is None:
+            self.distance, self.mode = distance, mode
+            return None
+        if (distance, mode) != (self.distance, self.mode):
+            raise ValueError('Checkpoint {} is for length {} in {} mode, '
+                             'not length {} in {} mode'.format(
+                             self.filename, self.distance, self.mode,
+                             distance, mode))
+        return self.dotcount
+        # }}}
+
+
+    def current(self, distance, dotcount):
+        # True if the checkpoint is for distance and dotcount.
+        return (distance, dotcount) == (self.distance, self.dotcount)
+
+
+    def begin(self, distance, dotcount):
+        # {{{
+        """
+        The run has moved on to dotcount, so the dotcounts before it
+        have no good combos.  Nothing changes if it already was on
+        dotcount, like when resuming.
+        """
+        if distance != self.distance or dotcount == self.dotcount:
+            return
+        self.dotcount = dotcount
+        self.position = None
+        self.bit_combos = []
+        self.count = 0
+        self._pending_combos = []
+        self._pending_count = 0
+        self.save_when_due()
+        # }}}
+
+
+    def resume(self, distance, dotcount):
+        # {{{
+        """
+        (position, bit_combos, count) to pick the search for dotcount
+        up from, the position and what was found before it, or
+        (None, [], 0) to start from the beginning.
+        """
+        if not self.current(distance, dotcount):
+            return None, [], 0
+        return self.position, list(self.bit_combos), self.count
+        # }}}
+
+
+    def found(self, distance, dotcount, bit_combos=(), count=0):
+        # {{{
+        """
+        Good bitwise combos found, or just how many, that will be
+        saved when progress() reaches a position after them.
+        """
+        if self.current(distance, dotcount):
+            self._pending_combos.extend(bit_combos)
+            self._pending_count += count
+        # }}}
+
+
+    def progress(self, distance, dotcount, position):
+        # {{{
+        """
+        The search for dotcount is done with everything before
+        position, and has reported all it found there to found().
+        """
+        if not self.current(distance, dotcount):
+            return
+        self.position = position
+        self.bit_combos.extend(self._pending_combos)
+        self.count += self._pending_count
+        self._pending_combos = []
+        self._pending_count = 0
+        self.save_when_due()
+        # }}}
+
+
+    def save_when_due(self):
+        # Save if it has been interval seconds since the last save.
+        if time.time() - self._saved_time >= self.interval:
+            self.save()
+
+
+    def save(self):
+        # {{{
+        """
+        Write the checkpoint file.  It only appears under filename
+        once it is complete, replacing the last one, so a run killed
+        while saving still leaves the last checkpoint to resume from.
+        """
+        values = {
+            'format': CHECKPOINT_FORMAT,
+            'args': self.args,
+            'distance': self.distance,
+            'mode': self.mode,
+            'dotcount': self.dotcount,
+            'position': self.position,
+            'bit_combos': self.bit_combos,
+            'count': self.count,}
+        partial = self.filename + '.partial'
+        with open(partial, 'w') as checkpoint_file:
+            json.dump(values, checkpoint_file)
+        os.replace(partial, self.filename)
+        self._saved_time = time.time()
+        logger.debug('Checkpoint saved to {} - {} dots, position {}'
+                     .format(self.filename, self.dotcount,
+                             self.position))
+        # }}}
+
+
+    def finish(self):
+        # {{{
+        # The run is over, so there is nothing left to resume.
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        # }}}
+
+    # }}}
@@ -0,0 +1,183 @@
+"""
+Known constructions of combos that measure any given distance.
+
+These are not guaranteed to use the fewest dots possible, but they
+come close, cost next to nothing to build, and always work, so the
+number of dots they use is a hard ceiling on the best dotcount.
+
+Wichmann rulers are the best known family of these.  See B. Wichmann,
+"A note on restricted difference bases", J. London Math. Soc. 1963.
+"""
+
+import math
+from . import _util
+from . import bitbased
+
+__version__ = _util.__version__
+__all__ = []
+
+# Checks combos with the same bit_combo_measures() as the searches.
+_bitwise = bitbased.HolesBitwise()
+
+
+def wichmann(r, s):
+    # {{{
+    """
+    Wichmann ruler W(r, s) as a sequence of dot positions.
+    It has 4r + s + 3 dots and measures every distance up to its
+    own, 4r(r + s + 2) + 3(s + 1).  Between dots it has gaps of
+        1 (r times), r+1, 2r+1 (r times), 4r+3 (s times),
+        2r+2 (r+1 times), 1 (r times)
+    Example: wichmann(1, 0) would return (0, 1, 3, 6, 10, 14, 15)
+    """
+    if r < 0 or s < 0: raise ValueError('r and s must be >= 0')
+
+    gaps = ((1,) * r + (r + 1,) + (2*r + 1,) * r + (4*r + 3,) * s +
+            (2*r + 2,) * (r + 1) + (1,) * r)
+    sequence = [0]
+    for gap in gaps:
+        sequence.append(sequence[-1] + gap)
+    return tuple(sequence)
+    # }}}
+
+
+def wichmann_distance(r, s):
+    """The distance measured by Wichmann ruler W(r, s)."""
+    return 4*r*(r + s + 2) + 3*(s + 1)
+
+
+def two_block(distance, block):
+    # {{{
+    """
+    A simple combo measuring distance: a block of dots 0 through
+    block - 1 measures the small distances, and dots every block
+    apart counting down from distance measure everything else.
+    Uses about 2 * sqrt(distance) dots when block ~ sqrt(distance).
+    """
+    if block < 1: raise ValueError('block must be >= 1')
+
+    dots = set(range(min(block, distance + 1)))
+    position = distance
+    while position > block - 1:
+        dots.add(position)
+        position -= block
+    dots.add(max(position, 0))
+    return tuple(sorted(dots))
+    # }}}
+
+
+def repair(sequence, distance):
+    # {{{
+    """
+    Make a sequence measure distance by clipping it to 0 through
+    distance, adding the endpoints, then greedily adding whichever
+    dot measures the most missing distances until none are missing,
+    and finally dropping any dots that turn out to be unnecessary.
+    """
+    bit_combo = _util.bits_from_sequence(
+        tuple(p for p in sequence if 0 <= p <= distance) + (0, distance))
+    needed = (1 << (distance + 1)) - 2
+
+    missing = needed & ~_measured(bit_combo, distance)
+    while missing:
+        # Mirrored once, for the distances below every position.
+        mirrored = _util.mirror_bits(bit_combo, distance)
+        best_position, best_gain = None, 0
+        for position in range(1, distance):
+            if bit_combo & (1 << position):
+                continue
+            gain = _util.bit_count(missing & _measured_from(
+                bit_combo, mirrored, position, distance))
+            if gain > best_gain:
+                best_position, best_gain = position, gain
+        # A new dot measures just the distances to the others.
+        missing &= ~_measured_from(bit_combo, mirrored, best_position,
+                                   distance)
+        bit_combo |= 1 << best_position
+
+    for position in range(1, distance):
+        trimmed = bit_combo & ~(1 << position)
+        if trimmed != bit_combo and _bitwise.bit_combo_measures(
+                trimmed, distance):
+            bit_combo = trimmed
+    return _util.sequence_from_bits(bit_combo)
+    # }}}
+
+
+def _measured(bit_combo, distance):
+    # Bitmask with bit n set if bit_combo has dots n apart.
+    measured = 0
+    for spacing in range(1, distance + 1):
+        if bit_combo & (bit_combo >> spacing):
+            measured |= 1 << spacing
+    return measured
+
+
+def _measured_from(bit_combo, mirrored, position, distance):
+    # Bitmask of distances from position to each dot in bit_combo,
+    # given mirrored, its mirror_bits() for distance.  Shifting that
+    # brings the dots below position to their distances from it.
+    above = bit_combo >> position
+    below = mirrored >> (distance - position)
+    return (above | below) & ~1
+
+
+def candidates(distance):
+    # {{{
+    """
+    Construction candidates for distance, not all of them valid
+    until repair()'ed.  Wichmann rulers at least as long as the
+    distance get cut down to it, shorter ones get extended, and
+    two_block() combos fill in for distances Wichmann rulers fit
+    poorly.
+    """
+    # two_block() dotcounts bottom out near a sqrt(distance) block.
+    root = int(math.sqrt(distance))
+    for block in range(max(root - 2, 1), root + 4):
+        yield two_block(distance, block)
+
+    r = 0
+    while wichmann_distance(r, 0) <= 2 * distance + 3:
+        # Shortest Wichmann ruler with this r reaching distance,
+        # and the longest one that does not.
+        s = 0
+        while wichmann_distance(r, s) < distance:
+            s += 1
+        ruler = wichmann(r, s)
+        yield ruler
+        yield tuple(wichmann_distance(r, s) - p for p in ruler)
+        if s > 0:
+            yield wichmann(r, s - 1)
+        r += 1
+    # }}}
+
+
+_best_constructions = dict()
+
+def best_construction(distance):
+    # {{{
+    """
+    The combo with the fewest dots among known constructions,
+    as a sequence like best_combos() returns.  It measures every
+    distance 1 through distance, but may not be optimal.
+    """
+    if distance < 0: raise ValueError('distance must be >= 0')
+    if distance == 0:
+        return (0,)
+
+    if distance not in _best_constructions:
+        best = None
+        for candidate in candidates(distance):
+            sequence = repair(candidate, distance)
+            if best is None or len(sequence) < len(best):
+                best = sequence
+        assert _bitwise.bit_combo_measures(
+            _util.bits_from_sequence(best), distance)
+        _best_constructions[distance] = best
+    return _best_constructions[distance]
+    # }}}
+
+
+def construction_dotcount(distance):
+    """The number of dots in best_construction(distance)."""
+    return len(best_construction(distance))
@@ -3,8 +3,16 @@ Gosper's hack, or something like it, for bit combination generation.
 
 Based ultimately on Gosper's hack in HAKMEM 175.
 Based directly on code.stephenmorley.org/articles/hakmem-item-175/
+
+Gosper's hack goes through combos in colex order, which is also
+increasing integer order.  rank() and unrank() convert between combos
+and their positions in that order (the combinatorial number system),
+so a run can be split, resumed, or sampled at any rank.
 """
 
+from math import factorial
+
+
 def bit_combos_gospers(length, dots):
     # TODO: Correct name and documentation for gosper's hack.
 
@@ -108,3 +116,162 @@ def bit_combos_gospers(length, dots):
 
     # }}}
 
+
+
+def bit_combos_gospers_pruned(length, dots, feasible, skipped=None,
+                              min_block=64):
+    # {{{
+    """
+    Like bit_combos_gospers(), but skips ahead past hopeless combos.
+    Gosper's hack goes in increasing integer order, so every combo
+    sharing the same high bits, a "prefix", comes out in one run.
+    Whenever the prefix changes, feasible(prefix, position) gets
+    called with the prefix bits at or above position (position
+    being the lowest of them), and if it returns False, the whole
+    run of combos with that prefix gets skipped without generating
+    them.  The remaining dots all go somewhere below position.
+    Runs shorter than min_block are not worth checking.
+    skipped, if given, is a one-item list the number of combos
+    skipped gets added to.
+    """
+    if dots == 0:
+        yield 0
+        return
+
+    assert length > 0
+    assert dots > 0
+    assert dots <= length
+
+    # blocks[position][free] is how many combos share a prefix,
+    # that is, how many ways free dots fit in position positions.
+    blocks = [[0] * (dots + 1) for position in range(length)]
+    for position in range(length):
+        blocks[position][0] = 1
+        for free in range(1, dots + 1):
+            if position > 0:
+                blocks[position][free] = (blocks[position - 1][free - 1]
+                                          + blocks[position - 1][free])
+
+    # Below this position, no run is long enough to bother checking,
+    # which is where most of the combos change, so it stays cheap.
+    lowest_checked = 0
+    while (lowest_checked < length and
+           max(blocks[lowest_checked]) < min_block):
+        lowest_checked += 1
+
+    bits = (1 << dots) - 1
+    position = dots - 1
+    while True:
+        # Check the prefix at and above the highest changed bit.
+        # Below that, Gosper's hack left the rest of the dots packed
+        # at the bottom, so this is the first combo with the prefix.
+        if position < lowest_checked:
+            block = 0
+        else:
+            prefix = (bits >> position) << position
+            free = dots - bin(prefix).count('1')
+            block = blocks[position][free]
+        if block >= min_block and not feasible(prefix, position):
+            if skipped is not None:
+                skipped[0] += block
+            # Jump to the last combo with the prefix, which has the
+            # rest of the dots packed up right below it.
+            bits = prefix | (((1 << free) - 1) << (position - free))
+        else:
+            yield bits
+
+        # Gosper's hack, see bit_combos_gospers() for the details.
+        rightmost = -bits & bits
+        leftbits = bits + rightmost
+        if leftbits & (1 << length) != 0 or leftbits == 0:
+            break
+        changed = bits ^ leftbits
+        rightbits = (changed // rightmost) >> 2
+        next_bits = leftbits | rightbits
+
+        position = (bits ^ next_bits).bit_length() - 1
+        bits = next_bits
+    # }}}
+
+
+def rank(bits):
+    # {{{
+    """
+    Where the combo bits comes in bit_combos_gospers() order, from 0.
+    With dots at positions c1 < c2 < ... < ck, that is
+    (c1 choose 1) + (c2 choose 2) + ... + (ck choose k).
+    """
+    if bits < 0:
+        raise ValueError('bits must not be negative')
+    index = 0
+    dot = 0
+    position = 0
+    while bits:
+        if bits & 1:
+            dot += 1
+            index += _choose(position, dot)
+        bits >>= 1
+        position += 1
+    return index
+    # }}}
+
+
+def unrank(index, length, dots):
+    # {{{
+    """
+    The combo at index in bit_combos_gospers(length, dots) order,
+    the inverse of rank().  Going from the top dot down, each dot is
+    at the highest position whose (position choose dot) still fits
+    in what is left of index.
+    """
+    if not 0 <= dots <= length:
+        raise ValueError('dots must be 0 through length')
+    if not 0 <= index < _choose(length, dots):
+        raise ValueError('index must be 0 through (length choose dots) - 1')
+    bits = 0
+    position = length
+    for dot in range(dots, 0, -1):
+        position -= 1
+        while _choose(position, dot) > index:
+            position -= 1
+        index -= _choose(position, dot)
+        bits |= 1 << position
+    return bits
+    # }}}
+
+
+def bit_combos_from_rank(length, dots, start=0, count=None):
+    # {{{
+    """
+    Like bit_combos_gospers(), but starting at the combo with rank
+    start, and stopping after count combos, if count is given.
+    """
+    if count is not None and count <= 0:
+        return
+    if start >= _choose(length, dots):
+        return
+    bits = unrank(start, length, dots)
+    while True:
+        yield bits
+        if count is not None:
+            count -= 1
+            if count == 0:
+                break
+        if bits == 0:
+            break
+
+        # Gosper's hack, see bit_combos_gospers() for the details.
+        rightmost = -bits & bits
+        leftbits = bits + rightmost
+        if leftbits & (1 << length) != 0:
+            break
+        changed = bits ^ leftbits
+        bits = leftbits | ((changed // rightmost) >> 2)
+    # }}}
+
+
+def _choose(n, r):
+    # How many ways to pick r of n things, exactly, for any size.
+    if r < 0 or r > n:
+        return 0
+    return factorial(n) // (factorial(r) * factorial(n - r))
@@ -150,7 +150,11 @@ class HolesIterator(_base.HolesBase):
             combo = (0,1)
             return (combo,)
         else:
-            inner_combos = self.all_combos(distance - 2, offset=1)
+            # Like all_combos(distance - 2, offset=1), but only for
+            # dotcounts worth searching, less the 2 endpoint dots.
+            inner_combos = chain.from_iterable(
+                self.combos_with_n_dots(distance - 2, n - 2, offset=1)
+                for n in self.dotcount_range(distance))
             combos = ( (0,) + c + (distance,) for c in inner_combos )
             return combos
         # }}}
@@ -0,0 +1,126 @@
+"""
+Shards of a search, for running it as many independent batch jobs.
+
+A shard is the combos with some dotcount and some given leading and
+trailing bits, written as a spec string of distance:dotcount:
+leading:trailing, like '14:7:1011:1'.  Each shard job writes the
+good combos it finds to a shard file, and merging the files gives
+the same good combos a single search would have found.
+
+A shard file is text, so it is easy to check on.  Header lines give
+the spec, then come the good bitwise combos, one decimal integer per
+line in increasing order, then footer lines with how the job went,
+ending with '# end' so half-written files are easy to spot:
+
+    # holey shard 1
+    # spec 14:7:1011:1
+    11279
+    ...
+    # found 9
+    # checked 210
+    # elapsed 0.012
+    # end
+"""
+
+import os
+from . import _util
+
+__version__ = _util.__version__
+__all__ = []
+
+SHARD_FORMAT = '# holey shard 1'
+
+
+def format_spec(distance, dotcount, leading, trailing):
+    # {{{
+    """The spec string for a shard, see parse_spec()."""
+    return '{}:{}:{}:{}'.format(distance, dotcount,
+                                ''.join(str(bit) for bit in leading),
+                                ''.join(str(bit) for bit in trailing))
+    # }}}
+
+
+def parse_spec(spec):
+    # {{{
+    """
+    (distance, dotcount, leading, trailing) from a shard spec
+    string, with leading and trailing as tuples of 0's and 1's.
+    """
+    fields = spec.strip().split(':')
+    if len(fields) != 4:
+        raise ValueError('Shard spec {!r} is not '
+                         'distance:dotcount:leading:trailing'.format(spec))
+    distance, dotcount, leading, trailing = fields
+    if not set(leading + trailing) <= set('01'):
+        raise ValueError('Shard spec {!r} givens must be 0s and 1s'
+                         .format(spec))
+    return (int(distance), int(dotcount),
+            tuple(int(bit) for bit in leading),
+            tuple(int(bit) for bit in trailing))
+    # }}}
+
+
+def write_shard(filename, spec, combos, footer):
+    # {{{
+    """
+    Write combos, in increasing order, to a shard file for spec.
+    footer is called after the last combo for a dict of footer
+    values, like how many were checked.  The file only appears
+    under filename once it is complete, so a job that dies leaves
+    nothing a merge would mistake for a finished shard.
+    Returns how many combos were written.
+    """
+    found = 0
+    partial = filename + '.partial'
+    with open(partial, 'w') as shard_file:
+        shard_file.write(SHARD_FORMAT + '\n')
+        shard_file.write('# spec {}\n'.format(spec))
+        for combo in combos:
+            shard_file.write('{:d}\n'.format(combo))
+            found += 1
+        values = footer()
+        values['found'] = found
+        for key in sorted(values):
+            shard_file.write('# {} {}\n'.format(key, values[key]))
+        shard_file.write('# end\n')
+    os.replace(partial, filename)
+    return found
+    # }}}
+
+
+def read_shard_spec(filename):
+    # {{{
+    # The spec from a shard file's header, without reading the rest.
+    with open(filename) as shard_file:
+        if shard_file.readline().rstrip('\n') != SHARD_FORMAT:
+            raise ValueError('{} is not a shard file'.format(filename))
+        key, _, spec = shard_file.readline()[2:].partition(' ')
+        if key != 'spec':
+            raise ValueError('{} has no shard spec'.format(filename))
+        return spec.strip()
+    # }}}
+
+
+def read_shard(filename, footer=None):
+    # {{{
+    """
+    Bitwise combos from a shard file, one at a time.  When done,
+    fills in dict footer, if given, with the file's footer values,
+    as floats.  Raises ValueError if the file was not finished.
+    """
+    finished = False
+    with open(filename) as shard_file:
+        for line in shard_file:
+            if not line.startswith('#'):
+                yield int(line)
+            elif line.startswith('# end'):
+                finished = True
+            elif footer is not None:
+                key, _, value = line[2:].partition(' ')
+                try:
+                    footer[key] = float(value)
+                except ValueError:
+                    pass
+    if not finished:
+        raise ValueError('Shard file {} is incomplete'.format(filename))
+    # }}}
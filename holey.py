@@ -6,9 +6,17 @@ import os
 import time
 import argparse
 import logging
+import platform
 import holes
 import holes._util as _util
 import holes._base as _base
+import holes.checkpoint as checkpoint
+
+# Cluster workers need numpy, like the cluster implementation.
+try:
+    import holes.bitcluster as bitcluster
+except ImportError:
+    bitcluster = None
 
 __all__ = []
 __version__ = _util.__version__
@@ -30,32 +38,83 @@ def main():
                 __version__,
                 sys.argv[1:]))
 
+    saved = None
     try:
+        # A cluster worker just runs tasks for its coordinator.
+        if args.worker:
+            if bitcluster is None:
+                raise Exception('Numpy implementations unavailable.')
+            bitcluster.run_worker(args.worker)
+            logger.info('Run finished')
+            return
+
         # Determine which holes implementation subclass to use.
+        # It gets closed when done, stopping any worker processes,
+        # after cancelling their search if anything goes wrong.
         holesclass=_base.implementations[args.impl]['_class']
-        holes = holesclass()
-
-        # Parallelized implementation needs to know how many processes
-        if args.impl == 'bitparallel':
-            holes.parallels = args.parallels
-
-        # If requested, loop from 1 through (-t) the specified length.
-        if args.thru:
-            lengths = range(1, args.length + 1)
-        else:
-            lengths = (args.length,)
-
-        # Loop through lengths (or just one length, if no -t)
-        for length in lengths:
-            best = holes.do_run(length)
-            print()
-            _util.print_combos(best)
-            print()
-            print(holes._stats_display_str())
-            print()
+        with holesclass() as holes:
+            # Parallelized implementation needs to know how many processes
+            if args.impl == 'bitparallel':
+                holes.parallels = args.parallels
+
+            # Cluster implementation listens for workers to connect,
+            # instead of starting its own.
+            if args.impl == 'cluster':
+                holes.address = args.listen
+                holes.local_workers = 0
+
+            # Stop at the first best combo found instead of finding all,
+            # or just count them.
+            if args.find_one:
+                holes.mode = 'one'
+            if args.count:
+                holes.mode = 'count'
+
+            # Bitwise implementations can skip mirror image combos.
+            if args.canonical:
+                holes.canonical = True
+
+            # Bitwise implementations build combos covering top distances.
+            if args.top_width is not None:
+                holes.top_width = args.top_width
+
+            # Numpy implementations can time a few blocksizes per length,
+            # remembering the fastest in a calibration file for this host.
+            if args.autotune:
+                holes.autotune = True
+                holes.calibration_file = calibration_filename()
+
+            # Long runs save checkpoints now and then, so they can be
+            # resumed if they get stopped.
+            saved = make_checkpoint(args)
+            holes.checkpoint = saved
+
+            # List, run, or merge shards, instead of the usual search.
+            if args.shard_count is not None:
+                for spec in holes.shard_specs(args.length,
+                                              args.shard_dots,
+                                              args.shard_count):
+                    print(spec)
+            elif args.run_shard is not None:
+                holes.run_shard(* args.run_shard)
+            elif args.merge_shards is not None:
+                print()
+                _util.print_combos(holes.do_merge_run(args.merge_shards))
+                print()
+                print(holes._stats_display_str())
+                print()
+            else:
+                search(holes, args)
+
+    except KeyboardInterrupt:
+        # Leaving the with block cancelled any search in progress.
+        logger.info('Run interrupted')
+        save_checkpoint(saved)
+        raise
 
     except Exception:
         logger.exception('An exception occurred.  Re-raising it.')
+        save_checkpoint(saved)
         raise
 
     else:  # No exception, so log normal finish.
@@ -66,6 +125,64 @@ def main():
     # }}}
 
 
+def search(holes, args):
+    # {{{
+    # The usual search for best combos, printing what it finds.
+    # If requested, loop from 1 through (-t) the specified length.
+    if args.thru:
+        lengths = range(1, args.length + 1)
+    else:
+        lengths = (args.length,)
+
+    # Loop through lengths (or just one length, if no -t), each with
+    # its own run, so each gets printed and logged as it finishes.
+    for length in lengths:
+        if args.quick:
+            best = holes.do_construction_run(length)
+        else:
+            best = holes.do_run(length)
+        print()
+        if args.count:
+            print(' {distance:>3d} / {result_n_dots:<3d}  '
+                  '{result_count:,d} best combos'.format(
+                  ** holes.run_summary))
+        else:
+            _util.print_combos(best)
+        print()
+        print(holes._stats_display_str())
+        print()
+    # }}}
+
+
+def make_checkpoint(args):
+    # {{{
+    # The checkpoint for a run, resumed from the --resume file, or a
+    # new one in the log directory for a search of one length by an
+    # implementation that saves its progress.  None if not wanted.
+    if args.resume is not None:
+        return checkpoint.Checkpoint.load(args.resume,
+                                          args.checkpoint_interval)
+    sharding = (args.shard_count, args.run_shard, args.merge_shards)
+    if (args.checkpoint_interval <= 0 or args.thru or args.quick
+            or args.impl not in ('bitwise', 'bitnumpy', 'bitparallel')
+            or any(arg is not None for arg in sharding)):
+        return None
+    return checkpoint.Checkpoint(checkpoint_filename(),
+                                 args.checkpoint_interval, sys.argv[1:])
+    # }}}
+
+
+def save_checkpoint(saved):
+    # {{{
+    # Save how far a stopped run got, and how to pick it up again.
+    if saved is None or saved.distance is None:
+        return
+    saved.save()
+    logger.info('Checkpoint saved - resume with --resume {}'.format(
+                saved.filename))
+    # }}}
+
+
 def configure_logging(debug=False):
     # {{{
     # Configures the logging output for the script/application.
@@ -95,7 +212,7 @@ def configure_logging(debug=False):
     # }}}
 
 
-def parse_command_line():
+def parse_command_line(argv=None):
     # {{{
     COMMAND_DESC = ''.join((
         'Find sets of dots that include dot pairs all ',
@@ -103,7 +220,10 @@ def parse_command_line():
         'The dots could represent the minimum number of ',
         'tick marks on a straightedge or holes in a template ',
         'that could measure all distances <= n.'))
-    parser = argparse.ArgumentParser(description=COMMAND_DESC)
+    # @file reads more arguments from file, one per line, for
+    # merging more shard files than fit on a command line.
+    parser = argparse.ArgumentParser(description=COMMAND_DESC,
+                                     fromfile_prefix_chars='@')
 
     # const values here are implementation_key values, see holes._base
     group = parser.add_mutually_exclusive_group()
@@ -128,6 +248,44 @@ def parse_command_line():
         metavar='count',
         help='Use parallelized bitwise implementation with numpy.')
         # Note impl set to bitparallel for -p below.
+    group.add_argument(
+        '-l',
+        dest='listen',
+        action='store',
+        type=parse_address,
+        metavar='host:port',
+        help='Use cluster implementation, coordinating workers that '
+             'connect to host:port (see -e).  Needs HOLES_AUTHKEY set '
+             'to a secret shared only with the workers, since they '
+             'exchange pickles, which can run code.')
+        # Note impl set to cluster for -l below.
+    group.add_argument(
+        '-e',
+        dest='worker',
+        action='store',
+        type=parse_address,
+        metavar='host:port',
+        help='Run as a cluster worker for the coordinator at '
+             'host:port (see -l), until it stops.  No length needed.  '
+             'Needs the coordinator\'s HOLES_AUTHKEY.')
+    group.add_argument(
+        '-r',
+        dest='impl',
+        action='store_const',
+        const='branch',
+        help='Use branch-and-bound backtracking implementation.')
+    group.add_argument(
+        '-j',
+        dest='impl',
+        action='store_const',
+        const='middle',
+        help='Use meet-in-the-middle implementation joining halves.')
+    group.add_argument(
+        '-x',
+        dest='impl',
+        action='store_const',
+        const='cover',
+        help='Use distance-driven cover search implementation.')
     group.add_argument(
         '-i',
         dest='impl',
@@ -141,6 +299,90 @@ def parse_command_line():
         const='iterold',
         help='Use old, non-class-based iterator implementation.')
 
+    parser.add_argument(
+        '-c',
+        dest='canonical',
+        action='store_true',
+        default=False,
+        help='Search only one of each mirror image pair of combos.')
+    parser.add_argument(
+        '-w',
+        dest='top_width',
+        action='store',
+        type=int,
+        metavar='width',
+        help='Only generate combos that measure the largest width '
+             'distances (bitwise and numpy, default 6).')
+    parser.add_argument(
+        '-f',
+        dest='find_one',
+        action='store_true',
+        default=False,
+        help='Find just one best combo, stopping as soon as one '
+             'turns up, instead of all of them.')
+    parser.add_argument(
+        '-k',
+        dest='count',
+        action='store_true',
+        default=False,
+        help='Only count the best combos, without keeping them.')
+    parser.add_argument(
+        '-a',
+        dest='autotune',
+        action='store_true',
+        default=False,
+        help='Time a few numpy blocksizes per length and use the '
+             'fastest, remembering them in a per-host calibration '
+             'file next to the logs.')
+    parser.add_argument(
+        '-s',
+        dest='shard_count',
+        action='store',
+        type=int,
+        metavar='count',
+        help='List specs of about count shards of the search for '
+             'length, to run as separate jobs with -S.')
+    parser.add_argument(
+        '-g',
+        dest='shard_dots',
+        action='store',
+        type=int,
+        metavar='dots',
+        help='Make the -s shards for combos with this many dots '
+             '(default the fewest the bounds allow).')
+    parser.add_argument(
+        '-S',
+        dest='run_shard',
+        action='store',
+        nargs=2,
+        metavar=('spec', 'file'),
+        help='Run the one shard with spec (from -s), writing the '
+             'good combos it finds to file.  No length needed.')
+    parser.add_argument(
+        '-M',
+        dest='merge_shards',
+        action='store',
+        nargs='+',
+        metavar='file',
+        help='Merge shard files from -S into the best combos.  Use '
+             '@listfile for a file listing them.  No length needed.')
+    parser.add_argument(
+        '--checkpoint',
+        dest='checkpoint_interval',
+        action='store',
+        type=float,
+        default=300.0,
+        metavar='seconds',
+        help='Save a checkpoint of the search for one length to the '
+             'log directory this often, 0 for never, to pick it up '
+             'again with --resume (default 300).')
+    parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store',
+        metavar='checkpoint',
+        help='Resume the run that saved checkpoint, with the same '
+             'options, where it left off.  No length needed.')
     parser.add_argument(
         '-d',
         dest='debug',
@@ -158,6 +400,13 @@ def parse_command_line():
         action='store_true',
         default=False,
         help='Show best combos for all lengths 1 thru given length.')
+    parser.add_argument(
+        '-q',
+        dest='quick',
+        action='store_true',
+        default=False,
+        help='Instantly show a good, maybe not best, combo from known '
+             'constructions instead of searching.')
     parser.add_argument(
         '-m',
         dest='message',
@@ -166,42 +415,150 @@ def parse_command_line():
     parser.add_argument(
         'length',
         type=int,
+        nargs='?',
         help='Show best dot combos for this length.')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    # Resumed runs get everything else from their checkpoint.
+    if args.resume is not None:
+        resumed = parse_command_line(
+            checkpoint.Checkpoint.load(args.resume).args)
+        resumed.resume = args.resume
+        resumed.debug = resumed.debug or args.debug
+        return resumed
 
     # If -p (parallelize) was specified, fill in desired implementation.
     if args.parallels != None:
         args.impl = 'bitparallel'
+    if args.listen != None:
+        args.impl = 'cluster'
+
+    # Clusters send pickles, so only to those who know the secret.
+    if ((args.listen != None or args.worker != None)
+            and not os.environ.get('HOLES_AUTHKEY')):
+        raise Exception('-l and -e need HOLES_AUTHKEY set to a secret '
+                        'shared by the coordinator and its workers.')
+
+    # Shards use parallelized implementation's partitions.
+    sharding = (args.shard_count, args.run_shard, args.merge_shards)
+    if sum(arg is not None for arg in sharding) > 1:
+        raise Exception('Use only one of -s, -S, or -M.')
+    if any(arg is not None for arg in sharding):
+        if args.impl not in ('bitwise', 'bitparallel'):
+            raise Exception('Shards use the parallelized '
+                            'implementation, or -p.')
+        if args.canonical or args.find_one or args.count:
+            raise Exception('Shards find all good combos, '
+                            'without -c, -f, or -k.')
+        args.impl = 'bitparallel'
+        if args.parallels is None:
+            args.parallels = 2
+    if args.shard_dots is not None and args.shard_count is None:
+        raise Exception('-g only goes with -s.')
+
+    # Cluster workers get everything else from the coordinator,
+    # and shard files say what length they are for.
+    if (args.worker != None or args.run_shard != None
+            or args.merge_shards != None):
+        return args
+    if args.length is None:
+        parser.error('the following arguments are required: length')
 
     # Validate the non-obvious.
     if args.impl not in _base.implementations:
-        if args.impl == 'bitnumpy' or args.impl == 'bitparallel':
+        if args.impl in ('bitnumpy', 'bitparallel', 'cluster'):
             raise Exception('Numpy implementations unavailable.')
         else:
             raise Exception('Invalid implementation specified.')
 
+    if args.canonical and args.impl not in ('bitwise', 'bitnumpy',
+                                            'bitparallel', 'cluster'):
+        raise Exception('Only bitwise implementations support -c.')
+
+    if args.find_one and args.count:
+        raise Exception('Use either -f or -k, not both.')
+
+    if args.quick and (args.find_one or args.count):
+        raise Exception('-q only shows one construction, '
+                        'without -f or -k.')
+
+    if args.top_width is not None:
+        if args.impl not in ('bitwise', 'bitnumpy'):
+            raise Exception('Only bitwise and numpy implementations '
+                            'support -w.')
+        if args.top_width < 1:
+            raise Exception('-w width must be at least 1.')
+
+    if args.autotune and args.impl not in ('bitnumpy', 'bitparallel',
+                                           'cluster'):
+        raise Exception('Only numpy implementations support -a.')
+
     return args
     # }}}
 
 
+def parse_address(text):
+    # {{{
+    # argparse type for host:port, as a (host, port) tuple.
+    host, sep, port = text.rpartition(':')
+    if not sep or not port.isdigit():
+        raise argparse.ArgumentTypeError(
+            'expected host:port, not {!r}'.format(text))
+    return (host or 'localhost', int(port))
+    # }}}
+
+
 def log_filename():
     # {{{
     # Use script's name in the logfile name, but remove extension.
     script = sys.argv[0]
     (basename_no_ext,ext) = os.path.splitext(os.path.basename(script))
 
-    # If a subdirectory named log exists, put the log there.
-    script_dir = os.path.dirname(script)
-    log_dir = os.path.join(script_dir, 'log')
-    if not os.path.isdir(log_dir):
-        log_dir = script_dir
-
     # Put together dir, script basename, datetime, and .log extension
     log_basename = '.'.join((basename_no_ext,
                              time.strftime('%Y-%m-%d.%H%M'),
                              'log'))
-    return os.path.join(log_dir, log_basename)
+    return os.path.join(log_directory(), log_basename)
+    # }}}
+
+
+def checkpoint_filename():
+    # {{{
+    # Like the log file's name, so it is easy to tell which run it
+    # is for.  Not .log, so prunelogs.sh leaves it.
+    script = sys.argv[0]
+    (basename_no_ext,ext) = os.path.splitext(os.path.basename(script))
+    checkpoint_basename = '.'.join((basename_no_ext,
+                                    time.strftime('%Y-%m-%d.%H%M'),
+                                    'checkpoint',
+                                    'json'))
+    return os.path.join(log_directory(), checkpoint_basename)
+    # }}}
+
+
+def calibration_filename():
+    # {{{
+    # Blocksize calibrations depend on the machine, so one file per
+    # host, next to the logs.  Not .log, so prunelogs.sh leaves it.
+    script = sys.argv[0]
+    (basename_no_ext,ext) = os.path.splitext(os.path.basename(script))
+    calibration_basename = '.'.join((basename_no_ext,
+                                     platform.node() or 'localhost',
+                                     'calibration',
+                                     'csv'))
+    return os.path.join(log_directory(), calibration_basename)
+    # }}}
+
+
+def log_directory():
+    # {{{
+    # If a subdirectory named log exists, put the log there.
+    script_dir = os.path.dirname(sys.argv[0])
+    log_dir = os.path.join(script_dir, 'log')
+    if not os.path.isdir(log_dir):
+        log_dir = script_dir
+    return log_dir
     # }}}
 
 
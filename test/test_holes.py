@@ -6,6 +6,11 @@ Requires a symlink to the holes package in this script's directory.
 
 import unittest
 import sys
+import os
+import tempfile
+import time
+import threading
+from multiprocessing.connection import Client
 import types # For isInstance on generator type
 from math import factorial as fact
 import holes
@@ -13,6 +18,9 @@ from test_holes_data import results
 from test_holes_data import results_w_givens
 import test_holes_util
 import test_holes_base
+import test_holes_bounds
+import test_holes_constructions
+import test_holes_gospers
 
 
 class TestHolesIterator(test_holes_base.TestHolesBase):
@@ -30,22 +38,429 @@ class TestHolesIterator(test_holes_base.TestHolesBase):
 
 
 class TestHolesBitwise(test_holes_base.TestHolesBase):
+    # Checkpoint saves to stop test_checkpoint_resume() runs after.
+    checkpoint_stops = (1, 3, 30)
+
     def setUp(self):
         impl_class = holes._base.implementations['bitwise']['_class']
         self.h = impl_class()
 
-class TestHolesBitwiseNumpy(test_holes_base.TestHolesBase):
+    def test_best_combos_canonical(self):
+        for distance in (0, 1, 2, 3, 6, 9, 13):
+            expected = tuple(self.h.best_combos(distance))
+            self.h.canonical = True
+            try:
+                actual = tuple(self.h.best_combos(distance))
+            finally:
+                self.h.canonical = False
+            self.assertSequenceEqual(actual, expected)
+
+    def test_count_best_combos_canonical(self):
+        self.h.mode = 'count'
+        self.h.canonical = True
+        for distance in (3, 6, 9, 13, 16):
+            expected = tuple(self.h.__class__().best_combos(distance))
+            self.assertEqual(self.h.count_best_combos(distance),
+                             (len(expected[0]), len(expected)))
+
+    def test_best_combos_unpruned(self):
+        for distance in (0, 1, 2, 3, 6, 9, 13):
+            expected = tuple(self.h.best_combos(distance))
+            self.h.prune_prefixes = False
+            try:
+                actual = tuple(self.h.best_combos(distance))
+            finally:
+                self.h.prune_prefixes = True
+            self.assertSequenceEqual(actual, expected)
+
+    def test_bit_combos_with_ends_pruned(self):
+        distance = 20
+        dotcount = 7
+        every = tuple(self.h.bit_combos_with_ends(distance, dotcount))
+        pruned = tuple(self.h.bit_combos_with_ends(distance, dotcount,
+                                                   prune=True))
+        # Pruning skips some, in order, but never a combo that works.
+        self.assertLess(len(pruned), len(every))
+        self.assertSequenceEqual(pruned, sorted(set(pruned) & set(every)))
+        good = [c for c in every if self.h.bit_combo_measures(c, distance)]
+        self.assertTrue(set(good) <= set(pruned))
+        label = 'bit_combos_pruned({}, {})'.format(distance, dotcount)
+        self.assertEqual(self.h.stats[label]['count'],
+                         len(every) - len(pruned))
+
+    def test_compatible_outer_patterns(self):
+        compatible = self.h.compatible_outer_patterns(3)
+        # Left dots 0,1,2 measure the top 3 with just the right end.
+        self.assertSequenceEqual(compatible[0b111], [1, 3, 5, 7])
+        # Left dot 0 alone needs right dots at both 1 and 2 in.
+        self.assertSequenceEqual(compatible[0b001], [7])
+
+    def test_best_combos_top_widths(self):
+        for distance in (3, 6, 9, 13):
+            expected = tuple(self.h.best_combos(distance))
+            for width in (1, 2, 3, 6):
+                self.h.top_width = width
+                try:
+                    actual = tuple(self.h.best_combos(distance))
+                finally:
+                    self.h.top_width = 6
+                self.assertSequenceEqual(actual, expected)
+
+    def test_bit_combos_covering_top(self):
+        distance = 13
+        dotcount = 6
+        width = 3
+        self.h.prune_prefixes = False  # Every combo covering the top.
+        every = self.h.bit_combos_with_ends(distance, dotcount)
+        expected = set(c for c in every if all(
+            c & (c >> d) for d in range(distance - width + 1, distance + 1)))
+        actual = tuple(self.h.bit_combos_covering_top(distance, dotcount,
+                                                      width))
+        self.assertEqual(len(actual), len(expected))
+        self.assertEqual(set(actual), expected)
+        label = 'bit_combos_covering_top({}, {}) skipped'.format(
+            distance, dotcount)
+        self.assertEqual(self.h.stats[label]['count'],
+                         fact(12) // (fact(4) * fact(8)) - len(expected))
+
+    def test_checkpoint_resume(self):
+        distance = 20
+        expected = self.h.do_run(distance)
+
+        class Stop(Exception):
+            pass
+
+        class StoppingCheckpoint(holes.checkpoint.Checkpoint):
+            # Saves every time, and stops the run after some saves.
+            most_kept = 0
+
+            def save(self):
+                super().save()
+                self.most_kept = max(self.most_kept, len(self.bit_combos))
+                self.stop -= 1
+                if not self.stop:
+                    raise Stop()
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, 'checkpoint.json')
+            for stop in self.checkpoint_stops:
+                self.h.checkpoint = StoppingCheckpoint(filename, 0)
+                self.h.checkpoint.stop = stop
+                with self.assertRaises(Stop):
+                    self.h.do_run(distance)
+                self.h.checkpoint = holes.checkpoint.Checkpoint.load(
+                    filename)
+                self.assertSequenceEqual(self.h.do_run(distance),
+                                         expected)
+                # Finished, so nothing left to resume.
+                self.assertFalse(os.path.exists(filename))
+
+            # Count-only mode checkpoints just the count, never any
+            # combos, all the way through.
+            self.h.mode = 'count'
+            self.h.checkpoint = StoppingCheckpoint(filename, 0)
+            self.h.checkpoint.stop = 0
+            self.h.do_run(distance)
+            self.assertEqual(self.h.checkpoint.most_kept, 0)
+            expected = self.h.run_summary['result_count']
+            for stop in self.checkpoint_stops:
+                self.h.checkpoint = StoppingCheckpoint(filename, 0)
+                self.h.checkpoint.stop = stop
+                with self.assertRaises(Stop):
+                    self.h.do_run(distance)
+                self.h.checkpoint = holes.checkpoint.Checkpoint.load(
+                    filename)
+                self.h.do_run(distance)
+                self.assertEqual(self.h.run_summary['result_count'],
+                                 expected)
+
+class TestHolesBranchBound(test_holes_base.TestHolesBase):
+    def setUp(self):
+        impl_class = holes._base.implementations['branch']['_class']
+        self.h = impl_class()
+
+    def test_best_combos_matches_bitwise(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        for distance in (9, 13, 17):
+            self.assertSequenceEqual(
+                tuple(self.h.best_combos(distance)),
+                tuple(bitwise.best_combos(distance)))
+
+class TestHolesMeetInMiddle(test_holes_base.TestHolesBase):
+    def setUp(self):
+        impl_class = holes._base.implementations['middle']['_class']
+        self.h = impl_class()
+
+    def test_best_combos_matches_bitwise(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        for distance in (3, 9, 14, 18):
+            self.assertSequenceEqual(
+                tuple(self.h.best_combos(distance)),
+                tuple(bitwise.best_combos(distance)))
+
+class TestHolesExactCover(test_holes_base.TestHolesBase):
+    def setUp(self):
+        impl_class = holes._base.implementations['cover']['_class']
+        self.h = impl_class()
+
+    def test_best_combos_matches_bitwise(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        for distance in (3, 9, 14, 18, 22):
+            self.assertSequenceEqual(
+                tuple(self.h.best_combos(distance)),
+                tuple(bitwise.best_combos(distance)))
+
+    def test_bit_combos_covered_extra_dots(self):
+        # 3 dots cover 3, so the 4th dot can go anywhere left over.
+        actual = sorted(set(self.h.bit_combos_covered(3, 4)))
+        self.assertSequenceEqual(actual, [0b1111])
+        actual = sorted(set(self.h.bit_combos_covered(4, 4)))
+        self.assertSequenceEqual(actual, [0b10111, 0b11011, 0b11101])
+
+class TestHolesBitwiseNumpy(TestHolesBitwise):
     def setUp(self):
         impl_class = holes._base.implementations['bitnumpy']['_class']
         self.h = impl_class()
 
+    def test_combo_blocks_np(self):
+        combo_blocks_np = holes.bitnumpy.combo_blocks_np
+        for length, dots in ((0, 0), (1, 1), (6, 0), (9, 4), (17, 6)):
+            expected = tuple(holes.gospers.bit_combos_gospers(length,
+                                                              dots))
+            actual = []
+            for block in combo_blocks_np(length, dots, 50):
+                self.assertLessEqual(len(block), 50)
+                actual.extend(block.tolist())
+            self.assertSequenceEqual(actual, expected)
+
+    def test_bit_combos_measure_mask_np(self):
+        distance = 17
+        combos = tuple(holes.gospers.bit_combos_gospers(distance + 1, 7))
+        expected = [self.h.bit_combo_measures(c, distance) for c in combos]
+        for spacing_blocksize in (1, 3, 8, 20):
+            self.h.spacing_blocksize = spacing_blocksize
+            # Shorter chunks reuse the buffers made for the first one.
+            for size in (len(combos), 1000, 7):
+                actual = []
+                for i in range(0, len(combos), size):
+                    chunk, mask = self.h.bit_combos_measure_mask_np(
+                        combos[i:i + size], distance)
+                    actual.extend(mask.tolist())
+                self.assertSequenceEqual(actual, expected)
+            # Buffers made for another spacing_blocksize get remade.
+            self.assertEqual(self.h._measure_spacings[0].shape[1],
+                             min(spacing_blocksize, distance))
+
+    def test_blocksize_autotune(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            calibration_file = os.path.join(temp_dir, 'calibration.csv')
+            self.h.autotune = True
+            self.h.calibration_file = calibration_file
+            self.h.tuning_blocksizes = (16, 64)
+            expected = tuple(self.h.__class__().best_combos(13))
+            self.assertSequenceEqual(tuple(self.h.best_combos(13)),
+                                     expected)
+            blocksize, rate = self.h.tuned[13]
+            self.assertIn(blocksize, (16, 64))
+            self.assertEqual(self.h.run_summary_extras(13)['blocksize'],
+                             blocksize)
+            # Another instance reads it back instead of timing it.
+            tuner = self.h.__class__()
+            tuner.autotune = True
+            tuner.calibration_file = calibration_file
+            tuner.tuning_blocksizes = ()
+            self.assertEqual(tuner.blocksize_for(13), blocksize)
+
+    def test_combo_blocks_np_words(self):
+        combo_blocks_np = holes.bitnumpy.combo_blocks_np
+        for length, dots, offset in ((70, 2, 0), (66, 3, 5), (130, 1, 3)):
+            expected = [c << offset for c in
+                        holes.gospers.bit_combos_gospers(length, dots)]
+            words = (length + offset) // 64 + 1
+            actual = []
+            for block in combo_blocks_np(length, dots, 50, offset, words):
+                self.assertEqual(block.shape[1], words)
+                actual.extend(holes.bitnumpy.ints_np(block))
+            self.assertSequenceEqual(actual, expected)
+
+    def test_bit_combos_that_measure_words(self):
+        for distance in (63, 64, 70, 128, 140):
+            good = holes._util.bits_from_sequence(
+                holes.constructions.best_construction(distance))
+            positions = holes._util.sequence_from_bits(good)[1:-1]
+            combos = [good] + [good & ~(1 << p) for p in positions]
+            expected = [c for c in combos
+                        if self.h.bit_combo_measures(c, distance)]
+            self.assertSequenceEqual(expected, [good])
+            actual = self.h.bit_combos_that_measure(iter(combos), distance)
+            self.assertSequenceEqual(tuple(actual), expected)
+
 ### TODO: Change base class back and uncomment more-specific tests
 # Note: Chnage base class to unittest.TestCase to skip normal tests
 #       and just do the parallelized-specific tests.
-class TestHolesBitwiseParallel(test_holes_base.TestHolesBase):
+class TestHolesBitwiseParallel(TestHolesBitwiseNumpy):
     def setUp(self):
         impl_class = holes._base.implementations['bitparallel']['_class']
         self.h = impl_class()
+        self.addCleanup(self.h.close)
+
+    def test_partition_givens(self):
+        distance = 14
+        dotcount = 6
+        every = set(self.h.bit_combos_with_ends(distance, dotcount))
+        for parallels in (1, 3, 6):
+            self.h.parallels = parallels
+            givens = self.h.partition_givens(distance, dotcount)
+            self.assertGreaterEqual(len(givens),
+                                    parallels * self.h.tasks_per_worker)
+            actual = []
+            for leading, trailing in givens:
+                actual.extend(self.h.bit_combos_with_givens(
+                    distance, dotcount, leading, trailing))
+            # Every combo in exactly one task.
+            self.assertEqual(len(actual), len(every))
+            self.assertEqual(set(actual), every)
+
+    def test_parallelize_merged_good_combos(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        distance = 17
+        dotcount = 7
+        expected = tuple(bitwise.good_bit_combos(distance, dotcount))
+        self.h.parallels = 3
+        self.h.result_batchsize = 3
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.assertSequenceEqual(tuple(combos), expected)
+        # Stopping early cancels the rest, and the next search
+        # uses the same pool.
+        pool = self.h._pool
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.assertEqual(next(combos), expected[0])
+        combos.close()
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.assertSequenceEqual(tuple(combos), expected)
+        self.assertIs(self.h._pool, pool)
+
+    def test_cancel(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        distance = 17
+        dotcount = 7
+        expected = tuple(bitwise.good_bit_combos(distance, dotcount))
+        self.h.mode = 'one'
+        found = tuple(self.h.good_bit_combos(distance, dotcount))
+        self.assertIn(found[0], expected)
+        pool = self.h._pool
+        self.h.mode = 'all'
+        # Cancelled before any task starts, so none of them finish.
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.h.cancel()
+        with self.assertRaises(holes.bitparallel.SearchCancelled):
+            tuple(combos)
+        self.h.mode = 'count'
+        self.h.count_good_bit_combos(distance, dotcount)
+        self.h.mode = 'all'
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.assertSequenceEqual(tuple(combos), expected)
+        self.assertIs(self.h._pool, pool)
+        # Dropping a search part way cancels it, not the next one.
+        combos = self.h.good_bit_combos(distance, dotcount)
+        next(combos)
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.assertSequenceEqual(tuple(combos), expected)
+
+    def test_checkpoint_resume_no_tasks(self):
+        # Saved before any task finished, like when the speculative
+        # search gets kept, so the position has no tasks in it.
+        distance = 20
+        expected = self.h.do_run(distance)
+        with tempfile.TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, 'checkpoint.json')
+            checkpoint = holes.checkpoint.Checkpoint(filename)
+            checkpoint.start(distance, self.h.mode)
+            checkpoint.dotcount = 8
+            checkpoint.position = []
+            checkpoint.save()
+            self.h.checkpoint = holes.checkpoint.Checkpoint.load(filename)
+            self.assertSequenceEqual(self.h.do_run(distance), expected)
+            self.assertFalse(os.path.exists(filename))
+
+    def test_shared_results(self):
+        shared = holes.bitparallel.SharedResults(2, 2, 5)
+        try:
+            attached = holes.bitparallel.SharedResults(
+                * shared.layout())
+            combos = [3, 1 << 70, (1 << 100) | 5]
+            self.assertEqual(attached.write(1, 7, combos), 3)
+            self.assertEqual(shared.read(1), ([7, 7, 7], combos))
+            # Wraps around the end of the ring buffer.
+            self.assertEqual(attached.write(1, 2, combos), 3)
+            self.assertEqual(shared.read(1), ([2, 2, 2], combos))
+            self.assertEqual(shared.read(0), ([], []))
+            # Full, and nobody reading it any more.
+            attached.write(0, 1, combos + combos[:2])
+            with self.assertRaises(holes.bitparallel.SearchCancelled):
+                attached.write(0, 1, combos, cancelled=lambda: True)
+            shared.read(0)
+            attached.tally(1, attached.CHECKED, 40)
+            self.assertEqual(shared.totals(), [40, 0, 0, 0])
+            attached.close()
+        finally:
+            shared.close()
+
+    def test_parallel_checked_stats(self):
+        distance = 17
+        dotcount = 7
+        sink = tuple(self.h.good_bit_combos(distance, dotcount))
+        label = 'parallel_checked({}, {})'.format(distance, dotcount)
+        self.assertEqual(
+            self.h.stats[label]['count'],
+            len(tuple(self.h.bit_combos_with_ends(distance, dotcount,
+                                                  prune=True))))
+
+    def test_worker_pool_reused(self):
+        with self.h.__class__() as h:
+            expected = tuple(self.h.best_combos(13))
+            self.assertSequenceEqual(tuple(h.best_combos(13)), expected)
+            pool = h._pool
+            self.assertIsNotNone(pool)
+            h.canonical = True
+            self.assertSequenceEqual(tuple(h.best_combos(13)), expected)
+            self.assertIs(h._pool, pool)
+        self.assertIsNone(h._pool)
+
+    def test_shards(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        distance = 17
+        dotcount = 7
+        expected = tuple(bitwise.good_bit_combos(distance, dotcount))
+        specs = self.h.shard_specs(distance, dotcount, 5)
+        self.assertGreaterEqual(len(specs), 5)
+        self.assertEqual(holes.shards.parse_spec(specs[0])[:2],
+                         (distance, dotcount))
+        with tempfile.TemporaryDirectory() as tempdir:
+            filenames = []
+            # Shard files can come in any order.
+            for index, spec in reversed(list(enumerate(specs))):
+                filename = os.path.join(tempdir, '{}.shard'.format(index))
+                self.h.run_shard(spec, filename)
+                filenames.append(filename)
+            self.assertSequenceEqual(
+                tuple(self.h.merge_shards(filenames)), expected)
+            # Leaving a shard out is no good either.
+            with self.assertRaises(ValueError) as raised:
+                tuple(self.h.merge_shards(filenames[1:]))
+            self.assertIn(specs[-1], str(raised.exception))
+            label = 'shard_checked({}, {})'.format(distance, dotcount)
+            self.assertEqual(
+                self.h.stats[label]['count'],
+                len(tuple(self.h.bit_combos_with_ends(distance, dotcount,
+                                                      prune=True))))
+            # A shard file cut short is no good.
+            with open(filenames[0]) as shard_file:
+                lines = shard_file.readlines()
+            with open(filenames[0], 'w') as shard_file:
+                shard_file.writelines(lines[:-1])
+            with self.assertRaises(ValueError):
+                tuple(self.h.merge_shards(filenames))
 
     def test_bit_combos_with_givens(self):
         distance = 8
@@ -71,6 +486,28 @@ class TestHolesBitwiseParallel(test_holes_base.TestHolesBase):
         actual = (holes._util.sequence_from_bits(ab) for ab in actual_bits)
         self.assertMatchesBestData(distance, actual, results_w_givens)
 
+    def test_speculative(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        distance = 17
+        expected = tuple(bitwise.best_combos(distance))
+        self.assertSequenceEqual(tuple(self.h.best_combos(distance)),
+                                 expected)
+        # The search past the best dotcount is always wasted.
+        self.assertIn('speculative_wasted(17)', self.h.stats)
+        self.assertIsNone(self.h._speculative)
+        self.assertFalse(self.h._searches)
+        self.h.mode = 'count'
+        self.assertEqual(self.h.count_best_combos(distance),
+                         (len(expected[0]), len(expected)))
+        self.h.mode = 'one'
+        self.assertIn(tuple(self.h.best_combos(distance))[0], expected)
+        self.h.mode = 'all'
+        self.h.speculative = False
+        self.h.stats.clear()
+        self.assertSequenceEqual(tuple(self.h.best_combos(distance)),
+                                 expected)
+        self.assertNotIn('speculative_wasted(17)', self.h.stats)
+
     def test_parallelize_good_combos(self):
         distance = 5
         dotcount = 4
@@ -80,6 +517,110 @@ class TestHolesBitwiseParallel(test_holes_base.TestHolesBase):
         finally:
             self.h.parallels = 2 # Default
 
+class TestHolesBitwiseCluster(TestHolesBitwiseNumpy):
+    # Clusters only checkpoint each dotcount as they get to it.
+    checkpoint_stops = (1, 2)
+
+    def setUp(self):
+        impl_class = holes._base.implementations['cluster']['_class']
+        self.h = impl_class()
+        self.addCleanup(self.h.close)
+
+    def misbehaving_worker(self, address, hang):
+        # Take a task, send its first batch, then either disconnect
+        # or hang, after starting a worker that does the job right.
+        conn = Client(address, authkey=self.h.authkey)
+        kind, task_id, task, lease_seconds = conn.recv()
+        settings, distance, dotcount, lead, trail = task
+        worker = self.h.__class__()
+        for name, value in settings.items():
+            setattr(worker, name, value)
+        combos = worker.child_good_combos(distance, dotcount, lead, trail)
+        batch = next(holes._util.chunkinate(combos, 3))
+        conn.send(('combos', task_id, batch))
+        threading.Thread(target=holes.bitcluster.run_worker,
+                         args=(address, self.h.authkey),
+                         daemon=True).start()
+        if hang:
+            time.sleep(1)
+        conn.close()
+
+    def test_lost_worker_retried(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        distance = 17
+        dotcount = 7
+        expected = tuple(bitwise.good_bit_combos(distance, dotcount))
+        for hang in (False, True):
+            self.h.close()
+            self.h.local_workers = 0
+            self.h.parallels = 1
+            self.h.tasks_per_worker = 1
+            self.h.result_batchsize = 3
+            self.h.lease_seconds = 0.2
+            address = self.h.coordinator().address
+            misbehaving = threading.Thread(target=self.misbehaving_worker,
+                                           args=(address, hang))
+            misbehaving.start()
+            combos = self.h.good_bit_combos(distance, dotcount)
+            # No repeats of the batch the first worker sent.
+            self.assertSequenceEqual(tuple(combos), expected)
+            misbehaving.join()
+
+    def test_lease_shorter_than_task(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        distance = 26
+        dotcount = 9
+        expected = tuple(bitwise.good_bit_combos(distance, dotcount))
+        self.h.parallels = 1
+        self.h.tasks_per_worker = 1
+        self.h.result_batchsize = 10
+        # Workers say they are still at it, between chunks.
+        self.h.lease_seconds = 0.05
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.assertSequenceEqual(tuple(combos), expected)
+        # Leases run out right away, so both workers get the task,
+        # and whichever finishes first does, with no repeats.  The
+        # other one gets cancelled, and is free for the next search.
+        self.h.lease_seconds = 0
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.assertSequenceEqual(tuple(combos), expected)
+        self.h.lease_seconds = 600
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.assertSequenceEqual(tuple(combos), expected)
+
+    def test_authkey_required(self):
+        # Anywhere but loopback, pickles need a shared secret.
+        self.h.close()
+        self.h.authkey = None
+        self.h.address = ('0.0.0.0', 0)
+        with self.assertRaises(ValueError):
+            self.h.coordinator()
+        self.h.address = ('localhost', 0)
+        self.h.coordinator()
+        self.assertTrue(self.h.authkey)
+
+    def test_cluster_modes(self):
+        bitwise = holes._base.implementations['bitwise']['_class']()
+        distance = 17
+        dotcount = 7
+        expected = tuple(bitwise.good_bit_combos(distance, dotcount))
+        self.h.parallels = 3
+        self.h.mode = 'count'
+        self.assertEqual(self.h.count_good_bit_combos(distance, dotcount),
+                         len(expected))
+        self.h.mode = 'one'
+        self.assertIn(tuple(self.h.good_bit_combos(distance, dotcount))[0],
+                      expected)
+        # Workers still on tasks from the last search get ignored.
+        self.h.mode = 'all'
+        combos = self.h.good_bit_combos(distance, dotcount)
+        self.assertSequenceEqual(tuple(combos), expected)
+        label = 'cluster_checked({}, {})'.format(distance, dotcount)
+        self.assertEqual(
+            self.h.stats[label]['count'],
+            len(tuple(self.h.bit_combos_with_ends(distance, dotcount,
+                                                  prune=True))))
+
 # Old implementations {{{
 # Filling in gaps in the old interfaces is low priority.
 #class TestHolesIteratorOld(test_holes_base.TestHolesBase):
@@ -104,6 +645,9 @@ def main(args):
         verbosity=1
     test_modules = (
         test_holes_util,        # Test _util 1st, in case tests use it
+        test_holes_bounds,
+        test_holes_constructions,
+        test_holes_gospers,
         sys.modules[__name__],) # This module itself
 
     allsuite = unittest.TestSuite()
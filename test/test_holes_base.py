@@ -147,5 +147,27 @@ class TestHolesBase(unittest.TestCase):
             sink = tuple(self.h.best_combos(4))
         #print(strio.getvalue())
 
+    def test_best_combos_find_one(self):
+        self.h.mode = 'one'
+        for distance in range(1, 5):
+            combos = self.h.collect_combos(self.h.best_combos(distance))
+            self.assertEqual(len(combos), 1)
+            expected = tuple(self.h.__class__().best_combos(distance))
+            self.assertIn(combos[0], expected)
+
+    def test_count_best_combos(self):
+        self.h.mode = 'count'
+        for distance in range(1, 9):
+            expected = tuple(self.h.__class__().best_combos(distance))
+            self.assertEqual(self.h.count_best_combos(distance),
+                             (len(expected[0]), len(expected)))
+
+    def test_do_run_nothing_found(self):
+        for mode in ('all', 'count'):
+            self.h.mode = mode
+            with self.assertRaises(ValueError):
+                self.h.do_run(0)
+            self.assertNotIn(0, self.h.known_best)
+
     # TODO: Add tests of exception conditions.     
     # }}}
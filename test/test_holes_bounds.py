@@ -0,0 +1,56 @@
+"""
+Unit tests for the holes package, bounds module.
+Requires a symlink to the holes package in this script's directory.
+"""
+import unittest
+import holes
+import holes.bounds as bounds
+from test_holes_data import results
+
+
+class TestHolesBounds(unittest.TestCase):
+
+    def test_pair_lower_bound(self):
+        eq = self.assertEqual
+
+        eq(bounds.pair_lower_bound(0), 0)
+        eq(bounds.pair_lower_bound(1), 2)
+        eq(bounds.pair_lower_bound(2), 3)
+        eq(bounds.pair_lower_bound(3), 3)
+        eq(bounds.pair_lower_bound(4), 4)
+        eq(bounds.pair_lower_bound(6), 4)
+        eq(bounds.pair_lower_bound(7), 5)
+        eq(bounds.pair_lower_bound(23), 8)
+
+    def test_pair_lower_bound_vs_data(self):
+        # No combo in the recorded data measures with fewer dots.
+        for length in results:
+            distance = length - 1
+            for dots in results[length]:
+                if any(c.measures and c.spans for c in results[length][dots]):
+                    self.assertGreaterEqual(dots,
+                        bounds.pair_lower_bound(distance))
+
+    def test_lower_bound_known(self):
+        eq = self.assertEqual
+        known_best = {9: 5, 13: 6}
+
+        eq(bounds.lower_bound(10)[0], 5)
+        eq(bounds.lower_bound(10, known_best)[0], 5)
+        eq(bounds.lower_bound(14, known_best)[0], 6)
+        eq(bounds.lower_bound(14, {13: 7})[0], 7)
+        # Only shorter distances count.
+        eq(bounds.lower_bound(12, {13: 7})[0], 6)
+
+    def test_do_run_skips_dotcounts(self):
+        impl_class = holes._base.implementations['bitwise']['_class']
+        h = impl_class()
+        h.do_run(13)
+        self.assertEqual(h.dotcount_bounds[13][0], 6)
+        self.assertEqual(h.known_best[13], 6)
+        h.do_run(14)
+        self.assertEqual(h.dotcount_bounds[14][0], 6)
+        self.assertEqual(h.dotcount_range(14)[0], 6)
+        # The search logs the dotcounts it does, and not the others.
+        self.assertIn('bit_combos_covering_top(14, 6)', h.stats)
+        self.assertNotIn('bit_combos_covering_top(14, 5)', h.stats)
@@ -0,0 +1,57 @@
+"""
+Unit tests for the holes package, constructions module.
+Requires a symlink to the holes package in this script's directory.
+"""
+import unittest
+import holes
+import holes._util as _util
+import holes.constructions as constructions
+
+
+class TestHolesConstructions(unittest.TestCase):
+
+    def setUp(self):
+        impl_class = holes._base.implementations['bitwise']['_class']
+        self.h = impl_class()
+
+    def assertMeasures(self, sequence, distance):
+        bits = _util.bits_from_sequence(sequence)
+        msg = '{} does not measure {}'.format(sequence, distance)
+        self.assertEqual(max(sequence), distance, msg)
+        self.assertTrue(self.h.bit_combo_measures(bits, distance), msg)
+
+    def test_wichmann(self):
+        eq = self.assertEqual
+
+        eq(constructions.wichmann(0, 0), (0, 1, 3))
+        eq(constructions.wichmann(1, 0), (0, 1, 3, 6, 10, 14, 15))
+        for r in range(4):
+            for s in range(4):
+                ruler = constructions.wichmann(r, s)
+                eq(len(ruler), 4*r + s + 3)
+                self.assertMeasures(ruler,
+                                    constructions.wichmann_distance(r, s))
+
+    def test_two_block(self):
+        for distance in (1, 2, 9, 23, 40):
+            for block in (1, 2, 3, 5):
+                self.assertMeasures(
+                    constructions.two_block(distance, block), distance)
+
+    def test_best_construction(self):
+        self.assertEqual(constructions.best_construction(0), (0,))
+        for distance in range(1, 80):
+            self.assertMeasures(
+                constructions.best_construction(distance), distance)
+
+    def test_best_construction_vs_search(self):
+        for distance in range(1, 18):
+            best = tuple(self.h.best_combos(distance))
+            self.assertGreaterEqual(
+                constructions.construction_dotcount(distance),
+                len(best[0]))
+
+    def test_do_construction_run(self):
+        combos = self.h.do_construction_run(23)
+        self.assertEqual(len(combos), 1)
+        self.assertMeasures(combos[0], 23)
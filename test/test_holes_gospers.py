@@ -0,0 +1,61 @@
+"""
+Unit tests for the holes package, gospers module.
+Requires a symlink to the holes package in this script's directory.
+"""
+import unittest
+import random
+import holes
+import holes.gospers as gospers
+
+
+class TestHolesGospers(unittest.TestCase):
+
+    def test_rank_unrank_match_gospers(self):
+        for length, dots in ((1, 0), (1, 1), (6, 0), (6, 6), (9, 4),
+                             (12, 5)):
+            combos = tuple(gospers.bit_combos_gospers(length, dots))
+            for index, bits in enumerate(combos):
+                self.assertEqual(gospers.rank(bits), index)
+                self.assertEqual(gospers.unrank(index, length, dots),
+                                 bits)
+
+    def test_unrank_big(self):
+        # Well past 64 bits, the last combo is all dots at the top.
+        length = 200
+        dots = 20
+        last = gospers._choose(length, dots) - 1
+        bits = gospers.unrank(last, length, dots)
+        self.assertEqual(bits, ((1 << dots) - 1) << (length - dots))
+        rng = random.Random(length)
+        for i in range(20):
+            index = rng.randrange(last + 1)
+            self.assertEqual(gospers.rank(gospers.unrank(index, length,
+                                                         dots)), index)
+
+    def test_unrank_out_of_range(self):
+        with self.assertRaises(ValueError):
+            gospers.unrank(10, 5, 2)
+        with self.assertRaises(ValueError):
+            gospers.unrank(-1, 5, 2)
+        with self.assertRaises(ValueError):
+            gospers.unrank(0, 5, 6)
+
+    def test_bit_combos_from_rank(self):
+        length = 11
+        dots = 4
+        combos = tuple(gospers.bit_combos_gospers(length, dots))
+        for start, count in ((0, None), (0, 5), (17, 40), (300, None),
+                             (329, 10), (330, None), (5, 0)):
+            stop = None if count is None else start + count
+            self.assertSequenceEqual(
+                tuple(gospers.bit_combos_from_rank(length, dots,
+                                                   start, count)),
+                combos[start:stop])
+        # Splitting at rank boundaries covers every combo once.
+        pieces = []
+        for start in range(0, len(combos), 64):
+            pieces.extend(gospers.bit_combos_from_rank(length, dots,
+                                                       start, 64))
+        self.assertSequenceEqual(pieces, combos)
+        self.assertSequenceEqual(
+            tuple(gospers.bit_combos_from_rank(5, 0)), (0,))
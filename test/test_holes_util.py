@@ -224,6 +224,30 @@ class TestHolesUtil(unittest.TestCase):
         eq(_util.bits_from_sequence((0, 2, 3, 5)), 0b101101)
     # }}}
 
+    # mirror_bits() tests {{{
+    def test_mirror_bits(self):
+        # (bits_int, distance)
+        eq = self.assertEqual
+
+        eq(_util.mirror_bits(0b1, 0), 0b1)
+        eq(_util.mirror_bits(0b11, 1), 0b11)
+        eq(_util.mirror_bits(0b1011, 3), 0b1101)
+        eq(_util.mirror_bits(0b1001101, 6), 0b1011001)
+        eq(_util.mirror_bits(0b0110, 4), 0b01100)
+    # }}}
+
+    # bit_count() tests {{{
+    def test_bit_count(self):
+        # (bits_int)
+        eq = self.assertEqual
+
+        eq(_util.bit_count(0b0), 0)
+        eq(_util.bit_count(0b1), 1)
+        eq(_util.bit_count(0b100000), 1)
+        eq(_util.bit_count(0b101101), 4)
+        eq(_util.bit_count(2**100 + 1), 2)
+    # }}}
+
     # combinations_count() tests {{{   ## TODO: Not working at all
 
     def test_combinations_count_1_small(self):